@@ -0,0 +1,310 @@
+# api/bench/fake_upstreams.py
+"""
+Local stand-ins for every upstream the API calls, for offline load tests.
+
+One FastAPI app serves the response shapes the API consumes:
+  - Overpass         POST /api/interpreter                       (poly/bbox unions with centers)
+  - Places           GET  /maps/api/place/nearbysearch/json, /maps/api/place/details/json
+  - Directions       GET  /maps/api/directions/json
+  - Gemini           POST /v1beta/models/{model}:generateContent (and :streamGenerateContent)
+
+Answers are deterministic: POIs come from a fixed pseudo-random field (the same area always
+returns the same elements, whichever query shape asks for it), place ids/ratings are hashes of
+the request. Each upstream sleeps for a latency drawn from a log-normal distribution
+(--latency NAME=MEDIAN_MS[:SIGMA]) and can fail a share of requests (--error-rate NAME=P; Overpass
+answers 429, Google 503).
+
+    python -m api.bench.fake_upstreams --port 9100 --latency overpass=800:0.6 --latency gemini=1500
+
+then point the API at it:
+
+    OVERPASS_URLS=http://127.0.0.1:9100/api/interpreter GMAPS_BASE_URL=http://127.0.0.1:9100 \\
+    GEMINI_BASE_URL=http://127.0.0.1:9100 GMAPS_API_KEY=fake GEMINI_API_KEY=fake \\
+    uvicorn api.main:app --port 8000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import numpy as np
+import polyline
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.map.geometry import points_in_polygon
+
+# name -> (median latency in ms, log-normal sigma)
+DEFAULT_LATENCY: Dict[str, Tuple[float, float]] = {
+    "overpass": (600.0, 0.5),
+    "places": (80.0, 0.4),
+    "directions": (120.0, 0.4),
+    "gemini": (1200.0, 0.4),
+}
+
+# Fake POI field: one candidate per GRID_DEG cell and amenity value, present with POI_PROBABILITY.
+GRID_DEG = 0.001
+POI_PROBABILITY = 0.05
+MAX_CELLS = 400_000
+
+_CLAUSE = re.compile(r'nwr((?:\[[^\]]*\])+)\((?:poly:"([^"]*)"|([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+))\)')
+_EQ_SELECTOR = re.compile(r'\["([^"]+)"="([^"]+)"\]')
+_RE_SELECTOR = re.compile(r'\["([^"]+)"~"\^\(([^"]*)\)\$"\]')
+_LIMIT = re.compile(r"out center (\d+);")
+
+_AMENITY_WORDS = {
+    "coffee": "cafe", "cafe": "cafe", "drink": "bar", "bar": "bar", "pub": "pub",
+    "beer": "pub", "pizza": "restaurant", "food": "restaurant", "eat": "restaurant",
+    "film": "cinema", "movie": "cinema", "cinema": "cinema", "fast": "fast_food",
+}
+
+
+def _hash01(*parts: Any) -> float:
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+class FakeUpstreams:
+    """Latency/error model shared by the fake endpoints."""
+
+    def __init__(self, latency: Optional[Dict[str, Tuple[float, float]]] = None, error_rate: Optional[Dict[str, float]] = None):
+        self.latency = dict(DEFAULT_LATENCY)
+        self.latency.update(latency or {})
+        self.error_rate = dict(error_rate or {})
+
+    async def delay(self, name: str) -> None:
+        median_ms, sigma = self.latency.get(name, (0.0, 0.0))
+        if median_ms > 0:
+            await asyncio.sleep(random.lognormvariate(math.log(median_ms), sigma) / 1000.0)
+
+    def should_fail(self, name: str) -> bool:
+        return random.random() < self.error_rate.get(name, 0.0)
+
+
+# ---------------- fake data ----------------
+def fake_pois(bbox: Tuple[float, float, float, float], key: str, values: List[str]) -> List[Dict[str, Any]]:
+    """Deterministic POIs tagged key=value (for each of `values`) inside (south, west, north, east)."""
+    south, west, north, east = bbox
+    i0, i1 = math.floor(south / GRID_DEG), math.floor(north / GRID_DEG)
+    j0, j1 = math.floor(west / GRID_DEG), math.floor(east / GRID_DEG)
+    if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_CELLS:
+        raise ValueError("area too large")
+    elements = []
+    for value in values:
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                if _hash01(key, value, i, j) >= POI_PROBABILITY:
+                    continue
+                lat = (i + _hash01("lat", value, i, j)) * GRID_DEG
+                lon = (j + _hash01("lon", value, i, j)) * GRID_DEG
+                if not (south <= lat <= north and west <= lon <= east):
+                    continue
+                osm_id = int(_hash01("id", key, value, i, j) * 10 ** 10)
+                tags = {key: value, "name": f"{value.replace('_', ' ').title()} {osm_id % 1000}"}
+                if _hash01("way", value, i, j) < 0.2:
+                    elements.append({"type": "way", "id": osm_id, "center": {"lat": lat, "lon": lon}, "tags": tags})
+                else:
+                    elements.append({"type": "node", "id": osm_id, "lat": lat, "lon": lon, "tags": tags})
+    return elements
+
+
+def answer_overpass(query: str) -> Dict[str, Any]:
+    elements: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for m in _CLAUSE.finditer(query):
+        selectors, poly = m.group(1), m.group(2)
+        if poly is not None:
+            nums = [float(x) for x in poly.split()]
+            polygon = list(zip(nums[0::2], nums[1::2]))
+            lats, lons = [p[0] for p in polygon], [p[1] for p in polygon]
+            bbox = (min(lats), min(lons), max(lats), max(lons))
+        else:
+            polygon = None
+            bbox = tuple(float(m.group(k)) for k in range(3, 7))
+        found: List[Dict[str, Any]] = []
+        for sel in _RE_SELECTOR.finditer(selectors):
+            found += fake_pois(bbox, sel.group(1), [v.replace("\\", "") for v in sel.group(2).split("|")])
+        for sel in _EQ_SELECTOR.finditer(selectors):
+            found += fake_pois(bbox, sel.group(1), [sel.group(2)])
+        if polygon is not None and found:
+            lat = np.array([e.get("lat", e.get("center", {}).get("lat")) for e in found])
+            lon = np.array([e.get("lon", e.get("center", {}).get("lon")) for e in found])
+            found = [e for e, keep in zip(found, points_in_polygon(lat, lon, polygon)) if keep]
+        for el in found:
+            elements[(el["type"], el["id"])] = el
+    out = list(elements.values())
+    if "out tags center bb;" in query:
+        # ways also get bounding boxes, as real Overpass returns them
+        for i, el in enumerate(out):
+            if "center" in el:
+                c = el["center"]
+                bounds = {"minlat": c["lat"] - GRID_DEG / 2, "minlon": c["lon"] - GRID_DEG / 2,
+                          "maxlat": c["lat"] + GRID_DEG / 2, "maxlon": c["lon"] + GRID_DEG / 2}
+                out[i] = {**el, "bounds": bounds}
+    limit = _LIMIT.search(query)
+    if limit:
+        out = out[: int(limit.group(1))]
+    return {"version": 0.6, "generator": "fake-overpass", "osm3s": {}, "elements": out}
+
+
+def _straight_route(origin: Tuple[float, float], destination: Tuple[float, float], bend: float) -> List[Tuple[float, float]]:
+    t = np.linspace(0.0, 1.0, 60)
+    lat = origin[0] + (destination[0] - origin[0]) * t + bend * np.sin(np.pi * t) * (destination[1] - origin[1])
+    lon = origin[1] + (destination[1] - origin[1]) * t - bend * np.sin(np.pi * t) * (destination[0] - origin[0])
+    return list(zip(lat.tolist(), lon.tolist()))
+
+
+def _haversine_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6_371_008.8 * math.asin(math.sqrt(h))
+
+
+_SPEED_MPS = {"driving": 11.0, "walking": 1.4, "bicycling": 4.5, "transit": 7.0}
+
+
+# ---------------- app ----------------
+def create_app(fake: Optional[FakeUpstreams] = None) -> FastAPI:
+    fake = fake or FakeUpstreams()
+    app = FastAPI(title="Fake upstreams")
+
+    @app.post("/api/interpreter")
+    async def overpass(request: Request):
+        await fake.delay("overpass")
+        if fake.should_fail("overpass"):
+            return JSONResponse({"remark": "rate limited"}, status_code=429)
+        # urlencoded by hand so the fake does not need python-multipart
+        form = parse_qs((await request.body()).decode("utf-8"))
+        try:
+            return answer_overpass(form.get("data", [""])[0])
+        except ValueError as e:
+            return JSONResponse({"remark": str(e)}, status_code=400)
+
+    @app.get("/maps/api/place/nearbysearch/json")
+    async def nearby(keyword: str = "", location: str = "0,0", radius: int = 100):
+        await fake.delay("places")
+        if fake.should_fail("places"):
+            return JSONResponse({"status": "UNKNOWN_ERROR"}, status_code=503)
+        if _hash01("zero", keyword, location) < 0.1:
+            return {"status": "ZERO_RESULTS", "results": []}
+        place_id = "fake_" + hashlib.sha1(f"{keyword}|{location}".encode("utf-8")).hexdigest()[:20]
+        return {"status": "OK", "results": [{"place_id": place_id, "name": keyword}]}
+
+    @app.get("/maps/api/place/details/json")
+    async def details(place_id: str, fields: str = ""):
+        await fake.delay("places")
+        if fake.should_fail("places"):
+            return JSONResponse({"status": "UNKNOWN_ERROR"}, status_code=503)
+        full = {
+            "name": f"Place {place_id[-6:]}",
+            "formatted_address": f"{int(_hash01('no', place_id) * 200)} Fake Street",
+            "rating": round(3.0 + 2.0 * _hash01("rating", place_id), 1),
+            "user_ratings_total": int(_hash01("count", place_id) * 2000),
+            "reviews": [
+                {
+                    "author_name": f"Reviewer {k}",
+                    "author_url": None,
+                    "rating": 1 + int(_hash01("r", place_id, k) * 5),
+                    "relative_time_description": "a month ago",
+                    "time": 1_700_000_000 + k,
+                    "text": "Lorem ipsum dolor sit amet. " * 8,
+                }
+                for k in range(5)
+            ],
+        }
+        wanted = [f for f in fields.split(",") if f] or list(full)
+        return {"status": "OK", "result": {f: full[f] for f in wanted if f in full}}
+
+    @app.get("/maps/api/directions/json")
+    async def directions(origin: str, destination: str, mode: str = "driving", alternatives: str = "false"):
+        await fake.delay("directions")
+        if fake.should_fail("directions"):
+            return JSONResponse({"status": "UNKNOWN_ERROR"}, status_code=503)
+        o = tuple(float(x) for x in origin.split(","))
+        d = tuple(float(x) for x in destination.split(","))
+        distance = _haversine_m(o, d) * 1.3
+        routes = []
+        for k, bend in enumerate([0.05, -0.12][: 2 if alternatives == "true" else 1]):
+            metres = int(distance * (1 + 0.15 * k))
+            routes.append({
+                "summary": f"Fake Road {k + 1}",
+                "overview_polyline": {"points": polyline.encode(_straight_route(o, d, bend))},
+                "legs": [{
+                    "distance": {"value": metres, "text": f"{metres / 1000:.1f} km"},
+                    "duration": {"value": int(metres / _SPEED_MPS.get(mode, 11.0)), "text": ""},
+                }],
+            })
+        return {"status": "OK", "routes": routes}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini(model_action: str, request: Request):
+        await fake.delay("gemini")
+        if fake.should_fail("gemini"):
+            return JSONResponse({"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}}, status_code=503)
+        body = await request.json()
+        prompt = " ".join(
+            part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+        ).lower()
+        values = sorted({v for word, v in _AMENITY_WORDS.items() if word in prompt}) or ["cafe", "restaurant"]
+        text = "[" + ", ".join(f'"amenity={v}"' for v in values) + "]"
+        usage = {"promptTokenCount": len(prompt.split()), "candidatesTokenCount": len(values) * 3}
+        if not model_action.endswith(":streamGenerateContent"):
+            return {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": usage,
+            }
+
+        # streamed: the list in a few pieces, then some trailing prose, as SSE `data:` lines
+        pieces = [text[i:i + 12] for i in range(0, len(text), 12)] + ["\nThese fit the group's request."]
+
+        async def sse():
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(0.05)
+                chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}, "index": 0}]}
+                if i == len(pieces) - 1:
+                    chunk["candidates"][0]["finishReason"] = "STOP"
+                    chunk["usageMetadata"] = usage
+                yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    return app
+
+
+# ---------------- CLI ----------------
+def _parse_latency(items: List[str]) -> Dict[str, Tuple[float, float]]:
+    parsed = {}
+    for item in items:
+        name, spec = item.split("=", 1)
+        median, _, sigma = spec.partition(":")
+        parsed[name.strip()] = (float(median), float(sigma) if sigma else DEFAULT_LATENCY.get(name.strip(), (0, 0.4))[1])
+    return parsed
+
+
+def _parse_rates(items: List[str]) -> Dict[str, float]:
+    return {name.strip(): float(p) for name, p in (item.split("=", 1) for item in items)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve fake Overpass/Places/Directions/Gemini upstreams.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", action="append", default=[], help="NAME=MEDIAN_MS[:SIGMA], e.g. overpass=800:0.6")
+    parser.add_argument("--error-rate", action="append", default=[], help="NAME=P, e.g. places=0.02")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    fake = FakeUpstreams(_parse_latency(args.latency), _parse_rates(args.error_rate))
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
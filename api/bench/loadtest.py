@@ -0,0 +1,186 @@
+# api/bench/loadtest.py
+"""
+End-to-end load test: virtual rooms repeatedly run the room flow against a running API
+
+    set_sample -> set_prompt -> search -> search/gmap -> compute-routes
+
+and the run reports requests, errors, p50/p95/p99 latency and requests/second per step and
+overall. Run it against an API wired to the fake upstreams (see api/bench/fake_upstreams.py):
+
+    python -m api.bench.loadtest --base-url http://127.0.0.1:8000 --rooms 20 --duration 60
+
+Each room draws its polygon around --center, up to --spread-m metres away, so searches mix cache
+hits (overlapping rooms) and misses. Use --json to also write the raw summary to a file.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+STEPS = ["set_sample", "set_prompt", "search", "search_gmap", "compute_routes"]
+
+PROMPTS = [
+    "Somewhere to grab coffee and talk",
+    "Cheap food before the cinema",
+    "A pub with room for eight people",
+    "Pizza or fast food near the station",
+]
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Recorder:
+    """Latencies and error counts per step."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {s: [] for s in STEPS}
+        self.errors: Dict[str, int] = {s: 0 for s in STEPS}
+        self.flows = 0
+
+    def add(self, step: str, latency: float, ok: bool) -> None:
+        self.latencies[step].append(latency)
+        if not ok:
+            self.errors[step] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        rows = {}
+        all_latencies: List[float] = []
+        for step in STEPS:
+            ordered = sorted(self.latencies[step])
+            all_latencies.extend(ordered)
+            rows[step] = _row(ordered, self.errors[step], elapsed)
+        total = _row(sorted(all_latencies), sum(self.errors.values()), elapsed)
+        return {"elapsed_s": round(elapsed, 2), "flows": self.flows, "steps": rows, "total": total}
+
+
+def _row(ordered: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    def ms(q: float) -> Optional[float]:
+        v = percentile(ordered, q)
+        return None if v is None else round(v * 1000, 1)
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": ms(0.50),
+        "p95_ms": ms(0.95),
+        "p99_ms": ms(0.99),
+    }
+
+
+def random_room_polygon(center: Tuple[float, float], spread_m: float, size_m: float) -> List[Dict[str, float]]:
+    """A jittered quadrilateral of roughly size_m x size_m somewhere within spread_m of center."""
+    dlat = 1.0 / 111_320.0
+    dlon = dlat / max(math.cos(math.radians(center[0])), 1e-6)
+    angle, dist = random.uniform(0, 2 * math.pi), random.uniform(0, spread_m)
+    clat = center[0] + math.sin(angle) * dist * dlat
+    clon = center[1] + math.cos(angle) * dist * dlon
+    half = size_m / 2
+    corners = [(-half, -half), (-half, half), (half, half), (half, -half)]
+    return [
+        {
+            "lat": clat + (y + random.uniform(-0.1, 0.1) * size_m) * dlat,
+            "lng": clon + (x + random.uniform(-0.1, 0.1) * size_m) * dlon,
+        }
+        for x, y in corners
+    ]
+
+
+async def _timed(client: httpx.AsyncClient, rec: Recorder, step: str, method: str, url: str, **kwargs: Any) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        resp = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        rec.add(step, time.perf_counter() - started, ok=False)
+        return None
+    rec.add(step, time.perf_counter() - started, ok=resp.status_code < 400)
+    return resp
+
+
+async def room_flow(client: httpx.AsyncClient, rec: Recorder, args: argparse.Namespace, room_id: int) -> None:
+    room = {"room": f"bench-{room_id}"}
+    polygon = random_room_polygon(args.center, args.spread_m, args.size_m)
+    await _timed(client, rec, "set_sample", "POST", "/api/map/set_sample", params=room, json=polygon)
+    await _timed(client, rec, "set_prompt", "POST", "/api/gemini/set_prompt", params=room,
+                 json={"prompt": random.choice(PROMPTS), "system_prompt": "Answer with a JSON list of amenity=value filters."})
+    amenity = random.choice(["restaurant", "cafe", "pub", "bar"])
+    await _timed(client, rec, "search", "GET", "/api/map/search", params={"amenity": amenity, **room})
+    resp = await _timed(client, rec, "search_gmap", "GET", "/api/map/search/gmap",
+                        params={"amenity": amenity, "top_n": args.top_n, "reviews_n": 2, **room})
+
+    destination = {"lat": polygon[0]["lat"], "lng": polygon[0]["lng"]}
+    if resp is not None and resp.status_code == 200:
+        found = [r for r in resp.json().get("gmap_results", []) if r.get("lat") is not None]
+        if found:
+            pick = random.choice(found)
+            destination = {"lat": pick["lat"], "lng": pick["lon"]}
+    origin = random_room_polygon(args.center, args.spread_m, args.size_m)[0]
+    await _timed(client, rec, "compute_routes", "POST", "/api/gmap/compute-routes",
+                 json={"origin": origin, "destination": destination, "travel_mode": "DRIVING"})
+    rec.flows += 1
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=args.rooms * 2, max_keepalive_connections=args.rooms * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+
+        async def room(room_id: int) -> None:
+            flows = 0
+            while time.perf_counter() < deadline and (not args.flows or flows < args.flows):
+                await room_flow(client, rec, args, room_id)
+                flows += 1
+
+        await asyncio.gather(*(room(1000 + i) for i in range(args.rooms)))
+        return rec.summary(time.perf_counter() - started)
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    header = f"{'step':<16}{'reqs':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(summary["steps"].items()) + [("TOTAL", summary["total"])]
+    for name, row in rows:
+        cells = [row["p50_ms"], row["p95_ms"], row["p99_ms"]]
+        print(f"{name:<16}{row['requests']:>8}{row['errors']:>8}{row['rps']:>9.2f}"
+              + "".join(f"{('-' if c is None else c):>10}" for c in cells))
+    print(f"\n{summary['flows']} room flows in {summary['elapsed_s']}s")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive room flows against the API and report latency percentiles.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rooms", type=int, default=10, help="concurrent virtual rooms")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--flows", type=int, default=0, help="stop each room after this many flows (0: no limit)")
+    parser.add_argument("--center", default="54.7753,-1.5849", help="lat,lon the rooms cluster around")
+    parser.add_argument("--spread-m", type=float, default=1500.0)
+    parser.add_argument("--size-m", type=float, default=600.0, help="approximate room polygon size")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args(argv)
+    args.center = tuple(float(x) for x in args.center.split(","))
+
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,227 @@
+# api/common/http_client.py
+"""
+Shared outbound HTTP layer for every upstream the API talks to (Overpass, Google Places,
+Google Directions).
+
+- One keep-alive httpx pool per upstream, so connections (and TLS sessions) are reused across
+  requests and one slow upstream cannot starve the others of connections.
+- Per-upstream timeouts and retry counts (UPSTREAMS, overridable with HTTP_<NAME>_TIMEOUT,
+  HTTP_<NAME>_MAX_CONNECTIONS and HTTP_<NAME>_RETRIES).
+- Retries on connection errors and 429/5xx with full-jitter exponential backoff, limited by a
+  process-wide retry budget: every request deposits RETRY_BUDGET_RATIO tokens and every retry
+  spends one, so during an outage retries add at most ~10% extra load instead of multiplying it.
+- Request/error/retry counters and latency percentiles per upstream (`stats()`).
+
+Callers go through `get_http_client()`:
+
+    resp = await get_http_client().request("places", "GET", url, params=params)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import httpx
+
+# HTTP statuses worth retrying (rate limited / temporarily unavailable).
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+RETRY_BUDGET_RATIO = float(os.environ.get("HTTP_RETRY_BUDGET_RATIO", "0.1"))
+RETRY_BUDGET_MIN_TOKENS = float(os.environ.get("HTTP_RETRY_BUDGET_MIN", "10"))
+BACKOFF_BASE_S = float(os.environ.get("HTTP_BACKOFF_BASE", "0.1"))
+BACKOFF_CAP_S = float(os.environ.get("HTTP_BACKOFF_CAP", "2.0"))
+
+
+class UpstreamConfig:
+    """Timeout (seconds), pool size and retry count for one upstream."""
+
+    def __init__(self, name: str, timeout: float, max_connections: int, retries: int):
+        prefix = f"HTTP_{name.upper()}_"
+        self.name = name
+        self.timeout = float(os.environ.get(prefix + "TIMEOUT", timeout))
+        self.max_connections = int(os.environ.get(prefix + "MAX_CONNECTIONS", max_connections))
+        self.retries = int(os.environ.get(prefix + "RETRIES", retries))
+
+
+# Overpass does its own mirror failover and hedging (see api.map.overpass_client), so the shared
+# layer never retries it; Google endpoints get two retries.
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    "overpass": UpstreamConfig("overpass", timeout=60.0, max_connections=20, retries=0),
+    "places": UpstreamConfig("places", timeout=10.0, max_connections=50, retries=2),
+    "directions": UpstreamConfig("directions", timeout=10.0, max_connections=50, retries=2),
+}
+
+
+class RetryBudget:
+    """Token bucket shared by all upstreams: requests deposit `ratio` tokens, retries spend one."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_tokens: float = RETRY_BUDGET_MIN_TOKENS):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.tokens = min_tokens
+        self.max_tokens = max(min_tokens, 100.0)
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            self.exhausted += 1
+            return False
+
+
+class UpstreamStats:
+    """Counters and a window of recent latencies for one upstream."""
+
+    def __init__(self, window: int = 1000):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.status_counts: Dict[int, int] = {}
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float, status_code: Optional[int] = None, error: bool = False) -> None:
+        self.requests += 1
+        self._latencies.append(latency)
+        if status_code is not None:
+            self.status_counts[status_code] = self.status_counts.get(status_code, 0) + 1
+        if error:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self._latencies)
+
+        def pct(q: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "status_counts": dict(self.status_counts),
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)},
+        }
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (1-based)."""
+    return random.uniform(0.0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** (attempt - 1))))
+
+
+class OutboundHTTP:
+    """Per-upstream httpx pools plus the retry budget and stats shared by all of them."""
+
+    def __init__(self, upstreams: Optional[Dict[str, UpstreamConfig]] = None):
+        self.upstreams = dict(upstreams or UPSTREAMS)
+        self.budget = RetryBudget()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, UpstreamStats] = {name: UpstreamStats() for name in self.upstreams}
+
+    # ---------- pools ----------
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        """The pooled client for `upstream` (created lazily so it binds to the running loop)."""
+        config = self.upstreams[upstream]
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=config.timeout,
+                limits=httpx.Limits(
+                    max_connections=config.max_connections,
+                    max_keepalive_connections=config.max_connections,
+                ),
+            )
+            self._clients[upstream] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def _stats_for(self, upstream: str) -> UpstreamStats:
+        return self._stats.setdefault(upstream, UpstreamStats())
+
+    # ---------- requests ----------
+    async def request(
+        self,
+        upstream: str,
+        method: str,
+        url: str,
+        retries: Optional[int] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        Send a request on `upstream`'s pool. Connection errors and RETRY_STATUSES are retried up
+        to `retries` times (default: the upstream's setting) while the retry budget allows; the
+        last response is returned (callers decide what an error status means) and the last
+        transport error is raised.
+        """
+        max_retries = self.upstreams[upstream].retries if retries is None else retries
+        stats = self._stats_for(upstream)
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                resp = await self.client(upstream).request(method, url, **kwargs)
+            except httpx.TransportError:
+                stats.record(time.monotonic() - started, error=True)
+                if attempt >= max_retries or not self.budget.try_spend():
+                    raise
+            else:
+                failed = resp.status_code in RETRY_STATUSES
+                stats.record(time.monotonic() - started, resp.status_code, error=resp.is_error)
+                if not failed or attempt >= max_retries or not self.budget.try_spend():
+                    return resp
+                await resp.aclose()
+            attempt += 1
+            stats.retries += 1
+            await asyncio.sleep(backoff_delay(attempt))
+
+    @asynccontextmanager
+    async def stream(self, upstream: str, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """Streaming request on `upstream`'s pool (never retried; latency is time to headers)."""
+        stats = self._stats_for(upstream)
+        self.budget.deposit()
+        started = time.monotonic()
+        recorded = False
+        try:
+            async with self.client(upstream).stream(method, url, **kwargs) as resp:
+                stats.record(time.monotonic() - started, resp.status_code, error=resp.is_error)
+                recorded = True
+                yield resp
+        except httpx.TransportError:
+            if not recorded:
+                stats.record(time.monotonic() - started, error=True)
+            raise
+
+    # ---------- metrics ----------
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "upstreams": {name: s.snapshot() for name, s in self._stats.items()},
+            "retry_budget": {"tokens": round(self.budget.tokens, 2), "exhausted": self.budget.exhausted},
+        }
+
+
+_HTTP: Optional[OutboundHTTP] = None
+
+
+def get_http_client() -> OutboundHTTP:
+    """Return the process-wide OutboundHTTP (created on first use)."""
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = OutboundHTTP()
+    return _HTTP
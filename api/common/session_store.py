@@ -0,0 +1,218 @@
+# api/common/session_store.py
+"""
+Room-scoped session state: the drawn polygon, the prompts and the Gemini response of each room.
+
+These used to be module globals (SAMPLE_DATA, USER_PROMPT, GEMINI_RESPONSE, ...), so rooms
+overwrote each other and a second uvicorn worker or serverless instance saw different state.
+Now every route reads and writes them through the store, keyed by room code:
+
+    store = get_session_store()
+    store.set(room, sample_data=[...])
+    polygons = store.get(room, "sample_data")
+
+Backends (SESSION_STORE):
+  - "memory" (default): a dict in this process. Fine for a single worker.
+  - "sqlite": a SQLite file (SESSION_STORE_PATH) shared by every worker on the host, or by
+    instances that mount the same volume.
+Values must be JSON-serializable. Rooms idle for SESSION_TTL seconds (default 1 day) expire.
+Requests without a room use DEFAULT_ROOM, which keeps the old single-room behaviour.
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+DEFAULT_ROOM = "default"
+
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL", str(24 * 3600)))
+
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "durhack_cache", "sessions.sqlite3")
+
+
+class SessionStore(ABC):
+    """Interface: per-room fields. `get` returns a copy, so callers may mutate what they read."""
+
+    @abstractmethod
+    def get(self, room: str, field: str, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def get_all(self, room: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def set(self, room: str, **fields: Any) -> None:
+        ...
+
+    @abstractmethod
+    def set_if_job(self, room: str, job_id: str, **fields: Any) -> bool:
+        """
+        Atomically write `fields` only if the room's `gemini_job` still has id `job_id` (so a
+        finished generation never overwrites the state of a newer one). Returns whether it did.
+        """
+
+    @abstractmethod
+    def clear(self, room: str) -> None:
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store."""
+
+    def __init__(self, ttl: int = SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._rooms: Dict[str, Dict[str, Any]] = {}
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _room(self, room: str) -> Dict[str, Any]:
+        if time.time() - self._touched.get(room, 0.0) > self.ttl:
+            self._rooms.pop(room, None)
+        return self._rooms.get(room, {})
+
+    def get(self, room: str, field: str, default: Any = None) -> Any:
+        with self._lock:
+            return copy.deepcopy(self._room(room).get(field, default))
+
+    def get_all(self, room: str) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy(self._room(room))
+
+    def set(self, room: str, **fields: Any) -> None:
+        with self._lock:
+            self._set_locked(room, fields)
+
+    def set_if_job(self, room: str, job_id: str, **fields: Any) -> bool:
+        with self._lock:
+            if (self._room(room).get("gemini_job") or {}).get("id") != job_id:
+                return False
+            self._set_locked(room, fields)
+            return True
+
+    def _set_locked(self, room: str, fields: Dict[str, Any]) -> None:
+        now = time.time()
+        values = self._room(room)
+        values.update(copy.deepcopy(fields))
+        self._rooms[room] = values
+        self._touched[room] = now
+        for stale in [r for r, t in self._touched.items() if now - t > self.ttl]:
+            self._rooms.pop(stale, None)
+            self._touched.pop(stale, None)
+
+    def clear(self, room: str) -> None:
+        with self._lock:
+            self._rooms.pop(room, None)
+            self._touched.pop(room, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite-backed store, one row per (room, field). A new connection is opened per operation so
+    several processes can share the file (callers in async code should go through
+    asyncio.to_thread for anything on a hot path).
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: int = SESSION_TTL_SECONDS):
+        self.path = path or os.environ.get("SESSION_STORE_PATH", DEFAULT_STORE_PATH)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS room_state (
+                    room TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (room, field)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_room_state_updated ON room_state (updated_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, room: str, field: str, default: Any = None) -> Any:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM room_state WHERE room = ? AND field = ? AND updated_at > ?",
+                (room, field, time.time() - self.ttl),
+            ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def get_all(self, room: str) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT field, value FROM room_state WHERE room = ? AND updated_at > ?",
+                (room, time.time() - self.ttl),
+            ).fetchall()
+        return {field: json.loads(value) for field, value in rows}
+
+    def set(self, room: str, **fields: Any) -> None:
+        with self._lock, self._connect() as conn:
+            self._write(conn, room, fields, time.time())
+
+    def set_if_job(self, room: str, job_id: str, **fields: Any) -> bool:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            # the conditional UPDATE takes the write lock first, so no other worker can replace
+            # gemini_job between the check and the write
+            matched = conn.execute(
+                """
+                UPDATE room_state SET updated_at = ?
+                WHERE room = ? AND field = 'gemini_job' AND json_extract(value, '$.id') = ? AND updated_at > ?
+                """,
+                (now, room, job_id, now - self.ttl),
+            ).rowcount
+            if not matched:
+                return False
+            self._write(conn, room, fields, now)
+        return True
+
+    def _write(self, conn: sqlite3.Connection, room: str, fields: Dict[str, Any], now: float) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO room_state (room, field, value, updated_at) VALUES (?, ?, ?, ?)",
+            [(room, field, json.dumps(value, separators=(",", ":")), now) for field, value in fields.items()],
+        )
+        # keep the whole room alive, not only the fields just written
+        conn.execute("UPDATE room_state SET updated_at = ? WHERE room = ?", (now, room))
+        conn.execute("DELETE FROM room_state WHERE updated_at <= ?", (now - self.ttl,))
+
+    def clear(self, room: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM room_state WHERE room = ?", (room,))
+
+
+_SESSION_STORE: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store for the SESSION_STORE backend (created on first use)."""
+    global _SESSION_STORE
+    if _SESSION_STORE is None:
+        backend = os.environ.get("SESSION_STORE", "memory").strip().lower()
+        if backend == "sqlite":
+            _SESSION_STORE = SQLiteSessionStore()
+        elif backend == "memory":
+            _SESSION_STORE = MemorySessionStore()
+        else:
+            raise ValueError(f"Unknown SESSION_STORE backend: {backend!r} (expected 'memory' or 'sqlite')")
+    return _SESSION_STORE
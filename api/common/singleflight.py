@@ -0,0 +1,51 @@
+# api/common/singleflight.py
+"""
+In-process single-flight: concurrent callers asking for the same thing share one upstream call.
+
+When several participants of a room open a page together they fire identical requests
+(Overpass searches, Places lookups, Directions). With
+
+    result = await flight.do(key, lambda: fetch(...))
+
+only the first caller for `key` runs `fetch`; everyone arriving while it is in flight awaits
+the same task and gets the same result (or exception). Nothing is cached once the call finishes.
+Results are shared objects, so callers must treat them as read-only.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one asyncio task."""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            # Run as its own task so a caller disconnecting (and being cancelled) does not cancel
+            # the upstream call for everyone else waiting on it.
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "in_flight": len(self._inflight), "calls": self.calls, "shared": self.shared}
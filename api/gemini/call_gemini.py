@@ -1,10 +1,14 @@
+import asyncio
 import os
 import sys
+from typing import AsyncIterator
 from dotenv import load_dotenv, find_dotenv
 
 from google import genai
 from google.genai import types
 
+from api.gemini.response_cache import get_response_cache, response_key
+
 # Load .env (if present)
 dotenv_path = find_dotenv()
 if dotenv_path:
@@ -19,16 +23,29 @@ if not api_key:
     # Keep existing behavior of exiting so the router can catch SystemExit
     sys.exit(1)
 
-client = genai.Client(api_key=api_key)
+# Optional alternative endpoint, e.g. the stand-in server in api/bench/fake_upstreams.py
+base_url = os.getenv("GEMINI_BASE_URL")
+
+client = genai.Client(
+    api_key=api_key,
+    http_options=types.HttpOptions(base_url=base_url) if base_url else None,
+)
 
 def generate_response(system_prompt: str, prompt: str, model: str = "gemini-2.5-flash"):
     """
     Generate a response using the Gemini client.
     *system_prompt* must be provided (string). *prompt* is the user prompt.
+    Identical (normalized) requests are answered from api.gemini.response_cache.
     """
+    # Make sure system_prompt is a string
+    system_instruction = system_prompt if isinstance(system_prompt, str) else str(system_prompt)
+    cache = get_response_cache()
+    key = response_key(system_instruction, prompt, model)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        # Make sure system_prompt is a string
-        system_instruction = system_prompt if isinstance(system_prompt, str) else str(system_prompt)
         config = types.GenerateContentConfig(system_instruction=system_instruction)
 
         response = client.models.generate_content(
@@ -38,8 +55,46 @@ def generate_response(system_prompt: str, prompt: str, model: str = "gemini-2.5-
         )
 
         # Response wrapper exposes .text in your previous code
-        return response.text
+        text = response.text
 
     except Exception as e:
         # Keep raising so callers can handle/log as appropriate
         raise RuntimeError(f"API request failed {e}")
+
+    # Empty answers (e.g. blocked by safety filters) are not worth keeping
+    if text:
+        cache.put(key, model, text)
+    return text
+
+
+async def stream_response(system_prompt: str, prompt: str, model: str = "gemini-2.5-flash") -> AsyncIterator[str]:
+    """
+    Async generator over the response text as the model produces it (SDK streaming API).
+    A cached response is yielded as a single chunk; a completed stream is added to the cache.
+    """
+    system_instruction = system_prompt if isinstance(system_prompt, str) else str(system_prompt)
+    cache = get_response_cache()
+    key = response_key(system_instruction, prompt, model)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        config = types.GenerateContentConfig(system_instruction=system_instruction)
+        stream = await client.aio.models.generate_content_stream(
+            model=model,
+            config=config,
+            contents=prompt
+        )
+        async for chunk in stream:
+            text = chunk.text
+            if text:
+                parts.append(text)
+                yield text
+    except Exception as e:
+        raise RuntimeError(f"API request failed {e}")
+
+    if parts:
+        await asyncio.to_thread(cache.put, key, model, "".join(parts))
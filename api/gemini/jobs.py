@@ -0,0 +1,160 @@
+# api/gemini/jobs.py
+"""
+Background Gemini generation jobs.
+
+A model call takes one to three seconds. Instead of holding a request (and a threadpool worker)
+open for it, the router submits a job and returns its id straight away:
+
+    job = get_job_registry().submit(generate_fn, system_prompt=sp, prompt=p)
+
+The blocking client call runs in a worker thread; clients learn about completion by long-polling
+(`await job.wait(timeout)`) or over Server-Sent Events. Identical requests (same
+api.gemini.response_cache key) submitted while one is still running share that job. Finished
+jobs are kept for JOB_TTL_SECONDS so late pollers can still read the result.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from api.gemini.response_cache import response_key
+
+JOB_TTL_SECONDS = int(os.environ.get("GEMINI_JOB_TTL", "600"))
+MAX_JOBS = int(os.environ.get("GEMINI_MAX_JOBS", "1000"))
+# Searches that depend on a room's Gemini filters wait this long for a generation (job or stream)
+# that is still running before falling back to their explicit amenity.
+SEARCH_WAIT_S = float(os.environ.get("GEMINI_SEARCH_WAIT_S", "10"))
+
+PENDING = "pending"
+DONE = "done"
+ERROR = "error"
+
+
+class GeminiJob:
+    """One generation request and, once finished, its response text or error message."""
+
+    def __init__(self, key: str, model: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.model = model
+        self.status = PENDING
+        self.response: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._done = asyncio.Event()
+        self._callbacks: List[Callable[["GeminiJob"], None]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status != PENDING
+
+    def add_done_callback(self, fn: Callable[["GeminiJob"], None]) -> None:
+        """Call `fn(job)` on completion (immediately if the job has already finished)."""
+        if self.finished:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def _finish(self, status: str, response: Optional[str] = None, error: Optional[str] = None) -> None:
+        self.status = status
+        self.response = response
+        self.error = error
+        self.finished_at = time.time()
+        self._done.set()
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to `timeout` seconds for the job to finish; returns whether it has."""
+        if not self.finished:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._done.wait()), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.finished
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "response": self.response,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRegistry:
+    """Process-local table of jobs by id, with in-flight de-duplication by request key."""
+
+    def __init__(self, ttl: int = JOB_TTL_SECONDS, max_jobs: int = MAX_JOBS):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, GeminiJob] = {}
+        self._inflight: Dict[str, GeminiJob] = {}
+        self._tasks: set = set()
+
+    def get(self, job_id: str) -> Optional[GeminiJob]:
+        return self._jobs.get(job_id)
+
+    def submit(
+        self,
+        generate_fn: Callable[..., Any],
+        system_prompt: str,
+        prompt: str,
+        model: Optional[str] = None,
+    ) -> GeminiJob:
+        """Start `generate_fn(system_prompt=..., prompt=..., [model=...])` in the background."""
+        key = response_key(system_prompt, prompt, model or "")
+        job = self._inflight.get(key)
+        if job is not None:
+            return job
+
+        self._prune()
+        job = GeminiJob(key, model)
+        self._jobs[job.id] = job
+        self._inflight[key] = job
+        kwargs: Dict[str, Any] = {"system_prompt": system_prompt, "prompt": prompt}
+        if model:
+            kwargs["model"] = model
+        task = asyncio.create_task(self._run(job, generate_fn, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: GeminiJob, generate_fn: Callable[..., Any], kwargs: Dict[str, Any]) -> None:
+        try:
+            text = await asyncio.to_thread(generate_fn, **kwargs)
+        except BaseException as exc:  # SystemExit from call_gemini included
+            self._inflight.pop(job.key, None)
+            job._finish(ERROR, error=str(exc) or exc.__class__.__name__)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            return
+        self._inflight.pop(job.key, None)
+        job._finish(DONE, response=text if isinstance(text, str) else str(text))
+
+    def _prune(self) -> None:
+        """Drop finished jobs past their TTL, then the oldest finished ones beyond max_jobs."""
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+        excess = len(self._jobs) - self.max_jobs + 1
+        if excess > 0:
+            for job in sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at)[:excess]:
+                del self._jobs[job.id]
+
+
+_JOB_REGISTRY: Optional[JobRegistry] = None
+
+
+def get_job_registry() -> JobRegistry:
+    """Return the process-wide JobRegistry (created on first use)."""
+    global _JOB_REGISTRY
+    if _JOB_REGISTRY is None:
+        _JOB_REGISTRY = JobRegistry()
+    return _JOB_REGISTRY
@@ -1,7 +1,7 @@
 # api/gemini/parse_gemini_resp.py
 import json
 import re
-from typing import List, Any
+from typing import List, Any, Optional, Tuple
 
 
 def _strip_trailing_and_leading(s: str) -> str:
@@ -144,3 +144,79 @@ def parse_gemini_response(raw_text: Any) -> List[str]:
         if p2:
             cleaned.append(p2.strip())
     return cleaned
+
+
+def find_complete_list(text: str, start: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Return the (start, end) slice of the first complete bracketed list in `text[start:]` (e.g.
+    '["amenity=bar", "amenity=cafe"]'), or None if no list has been closed yet. Brackets inside
+    quoted strings are ignored.
+    """
+    start = text.find("[", start)
+    if start < 0:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in ('"', "'"):
+            quote = ch
+        elif ch == "[":
+            depth += 1
+        elif ch == "]":
+            depth -= 1
+            if depth == 0:
+                return start, i + 1
+    return None
+
+
+def _is_filter(item: str) -> bool:
+    key, _, value = item.partition("=")
+    return bool(key.strip() and value.strip())
+
+
+class StreamingFilterParser:
+    """
+    Incremental counterpart of parse_gemini_response for streamed model output.
+
+        parser = StreamingFilterParser()
+        for chunk in chunks:
+            filters = parser.feed(chunk)   # the list, once, as soon as it is complete
+
+    Lists without any "key=value" item (e.g. "[see below]" in prose) are skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.filters: Optional[List[str]] = None
+        self._scan_from = 0
+
+    def feed(self, chunk: str) -> Optional[List[str]]:
+        """Add a chunk; returns the parsed filters the first time a complete list has arrived."""
+        self.text += chunk or ""
+        if self.filters is not None:
+            return None
+        while True:
+            span = find_complete_list(self.text, self._scan_from)
+            if span is None:
+                return None
+            start, end = span
+            items = parse_gemini_response(self.text[start:end])
+            if any(_is_filter(item) for item in items):
+                self.filters = items
+                return self.filters
+            self._scan_from = end
+
+    def finish(self) -> List[str]:
+        """Filters for the whole response (falls back to parse_gemini_response on the full text)."""
+        if self.filters is None:
+            self.filters = parse_gemini_response(self.text)
+        return self.filters
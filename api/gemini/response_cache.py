@@ -0,0 +1,160 @@
+# api/gemini/response_cache.py
+"""
+Two-tier cache for Gemini responses.
+
+Rooms keep sending the same "find me somewhere to eat/drink" prompts with the same system
+prompt, and each call costs quota and one to three seconds of model latency. Responses are
+keyed by a SHA-256 of the normalized (system_prompt, prompt, model): surrounding whitespace
+stripped, inner whitespace runs collapsed to one space and text case-folded, so "Pizza  near
+the station" and "pizza near the station " share an entry.
+
+Lookups go to an in-memory LRU first (GEMINI_CACHE_MEMORY_ENTRIES, default 512) and then to a
+SQLite table with TTL expiry (GEMINI_CACHE_TTL, default 1 day) and LRU trimming
+(GEMINI_CACHE_MAX_ENTRIES). A SQLite hit is promoted into the memory tier.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+DAY = 24 * 3600
+
+GEMINI_CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_CACHE_TTL", str(DAY)))
+MEMORY_ENTRIES = int(os.environ.get("GEMINI_CACHE_MEMORY_ENTRIES", "512"))
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "durhack_cache", "gemini_cache.sqlite3")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+# ---------------- keys ----------------
+def normalize_text(text: Optional[str]) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip().casefold()
+
+
+def response_key(system_prompt: Optional[str], prompt: Optional[str], model: str) -> str:
+    payload = json.dumps(
+        [normalize_text(system_prompt), normalize_text(prompt), model.strip().lower()],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---------------- cache ----------------
+class GeminiResponseCache:
+    """
+    Memory LRU in front of a SQLite store. The memory tier keeps each entry's expiry so it never
+    outlives the persistent one. Safe to call from worker threads.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        memory_entries: int = MEMORY_ENTRIES,
+        ttl: int = GEMINI_CACHE_TTL_SECONDS,
+    ):
+        self.path = path or os.environ.get("GEMINI_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("GEMINI_CACHE_MAX_ENTRIES", "20000"))
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS gemini_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_gemini_responses_access ON gemini_responses (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response, expires_at FROM gemini_responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE gemini_responses SET last_access = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO gemini_responses (key, model, response, expires_at, last_access)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (key, model, response, expires_at, now),
+                )
+                conn.execute("DELETE FROM gemini_responses WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    """
+                    DELETE FROM gemini_responses WHERE key IN (
+                        SELECT key FROM gemini_responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            with self._connect() as conn:
+                conn.execute("DELETE FROM gemini_responses")
+
+
+_RESPONSE_CACHE: Optional[GeminiResponseCache] = None
+
+
+def get_response_cache() -> GeminiResponseCache:
+    """Return the process-wide GeminiResponseCache (created on first use)."""
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        _RESPONSE_CACHE = GeminiResponseCache()
+    return _RESPONSE_CACHE
@@ -1,7 +1,17 @@
 import os
-import requests
+import asyncio
+import logging
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Set, Tuple
+
+from api.common.http_client import get_http_client
+from api.common.singleflight import SingleFlight
+from api.gmap.place_cache import (
+    fields_for_groups,
+    get_place_details_cache,
+    get_place_id_cache,
+    normalize_field_groups,
+)
 
 load_dotenv()
 API_KEY = os.getenv("GMAPS_API_KEY")
@@ -9,57 +19,195 @@ API_KEY = os.getenv("GMAPS_API_KEY")
 if not API_KEY:
     raise RuntimeError("GMAPS_API_KEY not found in .env file")
 
-# --- Helper functions ---
+# Override to point at a stand-in server (see api/bench/fake_upstreams.py)
+GMAPS_BASE_URL = os.getenv("GMAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
+NEARBY_SEARCH_URL = f"{GMAPS_BASE_URL}/maps/api/place/nearbysearch/json"
+PLACE_DETAILS_URL = f"{GMAPS_BASE_URL}/maps/api/place/details/json"
+DETAILS_FIELDS = "name,rating,user_ratings_total,reviews,formatted_address"
 
-def find_place_id(name: str, lat: float, lng: float, radius: int = 100) -> Optional[str]:
-    """
-    Search for a place near the given location and return its Google Place ID.
-    """
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
+# Nearby Search answers that are safe to remember (anything else is a transient/quota error)
+CACHEABLE_NEARBY_STATUSES = {"OK", "ZERO_RESULTS"}
+
+# Place Details statuses meaning the place_id itself is no longer valid (Google retires ids)
+STALE_PLACE_ID_STATUSES = {"NOT_FOUND", "INVALID_REQUEST"}
+
+# Concurrent identical Places lookups share one upstream call
+PLACES_FLIGHT = SingleFlight("places")
+DETAILS_FLIGHT = SingleFlight("place_details")
+
+# --- Request/response helpers ---
+
+def _nearby_params(name: str, lat: float, lng: float, radius: int) -> Dict[str, Any]:
+    return {
         "keyword": name,
         "location": f"{lat},{lng}",
         "radius": radius,
         "key": API_KEY,
     }
 
-    response = requests.get(url, params=params, timeout=10)
-    response.raise_for_status()
-    data = response.json()
 
+def _parse_nearby(data: Dict[str, Any]) -> Optional[str]:
     if data.get("status") == "OK" and data.get("results"):
         return data["results"][0]["place_id"]
     return None
 
 
-def get_place_details(place_id: str) -> Dict[str, Any]:
-    """
-    Retrieve details (rating, review count, and reviews) for a given Place ID.
-    """
-    url = "https://maps.googleapis.com/maps/api/place/details/json"
-    params = {
+def _details_params(place_id: str, fields: str = DETAILS_FIELDS) -> Dict[str, Any]:
+    return {
         "place_id": place_id,
-        "fields": "name,rating,user_ratings_total,reviews,formatted_address",
+        "fields": fields,
         "key": API_KEY,
     }
 
-    response = requests.get(url, params=params, timeout=10)
-    response.raise_for_status()
-    data = response.json()
 
-    if data.get("status") != "OK":
-        raise ValueError(f"Google Maps API error: {data.get('status')}")
-    
+class StalePlaceIdError(ValueError):
+    """Place Details rejected the place_id (NOT_FOUND/INVALID_REQUEST): it must be resolved again."""
+
+
+def _parse_details(data: Dict[str, Any]) -> Dict[str, Any]:
+    status = data.get("status")
+    if status in STALE_PLACE_ID_STATUSES:
+        raise StalePlaceIdError(f"Google Maps API error: {status}")
+    if status != "OK":
+        raise ValueError(f"Google Maps API error: {status}")
     return data["result"]
 
+# --- Lookups (async, on the shared keep-alive "places" pool) ---
+
+async def _nearby_search_async(name: str, lat: float, lng: float, radius: int) -> Dict[str, Any]:
+    response = await get_http_client().request(
+        "places", "GET", NEARBY_SEARCH_URL, params=_nearby_params(name, lat, lng, radius)
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def find_place_id_async(name: str, lat: float, lng: float, radius: int = 100) -> Optional[str]:
+    """
+    Search for a place near the given location and return its Google Place ID.
+    """
+    return _parse_nearby(await _nearby_search_async(name, lat, lng, radius))
+
 
-def call_gmaps(name: str, lat: float, lng: float, radius: int = 100) -> Optional[Dict[str, Any]]:
+async def resolve_place_id_async(
+    name: str,
+    lat: float,
+    lng: float,
+    radius: int = 100,
+    osm_type: Optional[str] = None,
+    osm_id: Optional[int] = None,
+) -> Optional[str]:
     """
-    Combined helper function - searches for a place and returns its full details.
+    find_place_id_async backed by the persistent place_id cache: repeat lookups for the same
+    OSM element (or the same name near the same spot) skip Nearby Search, including cached misses.
     """
-    place_id = find_place_id(name, lat, lng, radius)
+    cache = get_place_id_cache()
+    hit, place_id = await asyncio.to_thread(cache.lookup, name, lat, lng, radius, osm_type, osm_id)
+    if hit:
+        return place_id
+    data = await _nearby_search_async(name, lat, lng, radius)
+    place_id = _parse_nearby(data)
+    if data.get("status") in CACHEABLE_NEARBY_STATUSES:
+        await asyncio.to_thread(cache.put, name, lat, lng, radius, place_id, osm_type, osm_id)
+    return place_id
+
+
+async def _fetch_details_async(place_id: str, groups: Tuple[str, ...]) -> Dict[str, Any]:
+    """Fetch only the fields of `groups` from Place Details and store them in the details cache."""
+    async def fetch() -> Dict[str, Any]:
+        params = _details_params(place_id, fields_for_groups(groups))
+        response = await get_http_client().request("places", "GET", PLACE_DETAILS_URL, params=params)
+        response.raise_for_status()
+        result = _parse_details(response.json())
+        await asyncio.to_thread(get_place_details_cache().put, place_id, result, groups)
+        return result
+
+    return await DETAILS_FLIGHT.do((place_id, groups), fetch)
+
+
+_REFRESH_TASKS: Set[asyncio.Task] = set()
+
+
+def _schedule_refresh(place_id: str, groups: Tuple[str, ...]) -> None:
+    """Refresh stale field groups in the background; the caller has already been answered."""
+    async def refresh() -> None:
+        try:
+            await _fetch_details_async(place_id, groups)
+        except Exception:
+            logging.exception("Background refresh of place %s (%s) failed", place_id, ",".join(groups))
+
+    task = asyncio.create_task(refresh())
+    _REFRESH_TASKS.add(task)
+    task.add_done_callback(_REFRESH_TASKS.discard)
+
+
+async def get_place_details_async(place_id: str, field_groups: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Retrieve details for a given Place ID, limited to `field_groups` ("basic", "rating", "reviews"; default all),
+    served from the details cache. Missing groups are fetched before returning; groups past their
+    TTL are returned as cached and refreshed in the background.
+    """
+    groups = normalize_field_groups(field_groups)
+    cached = await asyncio.to_thread(get_place_details_cache().get, place_id, groups)
+    missing = tuple(g for g in groups if g not in cached)
+    stale = tuple(g for g in groups if g in cached and not cached[g][1])
+
+    details: Dict[str, Any] = {}
+    for group in groups:
+        if group in cached:
+            details.update(cached[group][0])
+    if missing:
+        # a round trip is needed anyway, so refresh the stale groups with it
+        refetch = tuple(g for g in groups if g in missing or g in stale)
+        details.update(await _fetch_details_async(place_id, refetch))
+    elif stale:
+        _schedule_refresh(place_id, stale)
+    return details
+
+
+async def _call_gmaps_uncoalesced(
+    name: str,
+    lat: float,
+    lng: float,
+    radius: int,
+    osm_type: Optional[str],
+    osm_id: Optional[int],
+    groups: Tuple[str, ...],
+) -> Optional[Dict[str, Any]]:
+    place_id = await resolve_place_id_async(name, lat, lng, radius, osm_type, osm_id)
     if not place_id:
         return None
+    try:
+        return await get_place_details_async(place_id, groups)
+    except StalePlaceIdError:
+        # a cached place_id Google has since retired: forget it and run Nearby Search once more
+        logging.info("Place id %s for %r is no longer valid; resolving it again", place_id, name)
+        await asyncio.to_thread(get_place_id_cache().invalidate, name, lat, lng, radius, osm_type, osm_id)
+    place_id = await resolve_place_id_async(name, lat, lng, radius, osm_type, osm_id)
+    if not place_id:
+        return None
+    return await get_place_details_async(place_id, groups)
 
-    details = get_place_details(place_id)
-    return details
+
+async def call_gmaps_async(
+    name: str,
+    lat: float,
+    lng: float,
+    radius: int = 100,
+    osm_type: Optional[str] = None,
+    osm_id: Optional[int] = None,
+    field_groups: Optional[Iterable[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Combined helper function - searches for a place and returns its details. Reuses
+    cached place_ids (pass the OSM `osm_type`/`osm_id` when known) and cached details, returns
+    only the requested `field_groups` (default all) and coalesces concurrent identical lookups
+    (same name, location ~1 m, radius, field groups) into one.
+    Returns None only when no place matches; a found place whose requested fields are all
+    absent (e.g. field_groups=("rating",) for an unrated place) gives an empty dict.
+    """
+    groups = normalize_field_groups(field_groups)
+    key = (name.strip().lower(), round(lat, 5), round(lng, 5), radius, groups)
+    return await PLACES_FLIGHT.do(
+        key, lambda: _call_gmaps_uncoalesced(name, lat, lng, radius, osm_type, osm_id, groups)
+    )
@@ -0,0 +1,105 @@
+# api/gmap/directions.py
+"""
+Async Google Directions lookups behind the route cache.
+
+`get_routes` answers from the route cache when it can; otherwise one Directions call is made
+(concurrent identical requests share it) on the shared "directions" HTTP pool and the compact
+result is cached. Routes are returned as dicts with the encoded overview polyline, distance in
+metres, duration in seconds and Google's route summary.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.common.http_client import get_http_client
+from api.common.singleflight import SingleFlight
+from api.gmap.route_cache import get_route_cache, route_key
+
+# You MUST set this environment variable for directions to work
+GMAPS_API_KEY = os.environ.get("GMAPS_API_KEY", "YOUR_GOOGLE_MAPS_API_KEY_HERE")
+# Override to point at a stand-in server (see api/bench/fake_upstreams.py)
+GMAPS_BASE_URL = os.environ.get("GMAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
+GMAPS_DIRECTIONS_URL = f"{GMAPS_BASE_URL}/maps/api/directions/json"
+
+# Concurrent identical route requests (e.g. every viewer of one result page) share one call
+DIRECTIONS_FLIGHT = SingleFlight("directions")
+
+
+class DirectionsError(RuntimeError):
+    """Raised when Google Directions answers with a status other than OK."""
+
+    def __init__(self, status: str, message: Optional[str] = None):
+        super().__init__(message or f"Route calculation failed with status: {status}")
+        self.status = status
+
+
+# ---------- upstream call ----------
+def _compact_routes(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The parts of each Directions route the API serves (first leg only; no waypoints are used)."""
+    routes = []
+    for route in data.get("routes") or []:
+        leg = (route.get("legs") or [{}])[0]
+        routes.append({
+            "polyline": route["overview_polyline"]["points"],
+            "distance_meters": (leg.get("distance") or {}).get("value"),
+            "duration_seconds": (leg.get("duration") or {}).get("value"),
+            "summary": route.get("summary"),
+        })
+    return routes
+
+
+async def _fetch_routes(
+    key: str,
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    travel_mode: str,
+    alternatives: bool,
+) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    cache = get_route_cache()
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached[0], cached[1], None
+    if not alternatives:
+        # an alternatives lookup for the same pair starts with the primary route
+        cached = await asyncio.to_thread(cache.get, route_key(origin, destination, travel_mode, True))
+        if cached is not None:
+            return cached[0], cached[1][:1], None
+
+    params = {
+        "origin": f"{origin[0]},{origin[1]}",
+        "destination": f"{destination[0]},{destination[1]}",
+        "mode": travel_mode.lower(),
+        "key": GMAPS_API_KEY,
+    }
+    if alternatives:
+        params["alternatives"] = "true"
+    response = await get_http_client().request("directions", "GET", GMAPS_DIRECTIONS_URL, params=params)
+    response.raise_for_status()
+    data = response.json()
+    status = data.get("status", "UNKNOWN_ERROR")
+    routes = _compact_routes(data) if status == "OK" else []
+    await asyncio.to_thread(cache.put, key, status, routes)
+    return status, routes, data.get("error_message")
+
+
+async def get_routes(
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    travel_mode: str = "DRIVING",
+    alternatives: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Routes from `origin` to `destination` ((lat, lng) pairs) for `travel_mode`: the recommended
+    route first, followed by Google's alternatives when `alternatives` is set.
+
+    Raises DirectionsError for non-OK statuses (ZERO_RESULTS, NOT_FOUND, OVER_QUERY_LIMIT, ...)
+    and httpx.HTTPError when Google cannot be reached or answers with an HTTP error.
+    """
+    key = route_key(origin, destination, travel_mode, alternatives)
+    status, routes, message = await DIRECTIONS_FLIGHT.do(
+        key, lambda: _fetch_routes(key, origin, destination, travel_mode, alternatives)
+    )
+    if status != "OK":
+        raise DirectionsError(status, message)
+    return routes
@@ -0,0 +1,162 @@
+# api/gmap/enrich.py
+"""
+Google Maps enrichment of Overpass elements, shared by the map search and room pipeline routes.
+
+Each element is looked up by a search name built from its OSM tags (name/brand plus address)
+near its point or center, and summarised as name, location, rating and a few reviews.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.gmap.call_gmaps import call_gmaps_async
+from api.gmap.place_cache import normalize_field_groups
+from api.map.leaflet_to_overpass import get_latlon_from_element
+
+
+# ---------------- search names ----------------
+def _extract_addr_tags(tags: Dict[str, Any]) -> Dict[str, str]:
+    """Return a dict of addr:* tags from the tags dict."""
+    return {k: v for k, v in tags.items() if isinstance(k, str) and k.startswith("addr:")}
+
+
+def _build_search_name(tags: Dict[str, Any]) -> str:
+    """
+    Construct a good 'name' string to pass to Google Maps:
+    Prefer tags['name'] or tags['brand']. If not present, build from addr:* fields.
+    Append street/city/housenumber where possible to make the search more precise.
+    """
+    if not tags:
+        return ""
+    # preferred name fields
+    name = tags.get("name") or tags.get("brand") or tags.get("operator") or ""
+    addr = _extract_addr_tags(tags)
+    street = addr.get("addr:street") or addr.get("addr:place") or ""
+    housenumber = addr.get("addr:housenumber") or ""
+    city = addr.get("addr:city") or addr.get("addr:town") or addr.get("addr:village") or ""
+    parts = []
+    if name:
+        parts.append(name)
+    if housenumber:
+        # place housenumber before street for address clarity
+        if street:
+            parts.append(f"{housenumber} {street}")
+        else:
+            parts.append(housenumber)
+    elif street:
+        parts.append(street)
+    if city:
+        parts.append(city)
+    # fallback to amenity type if nothing else
+    if not parts and tags.get("amenity"):
+        parts.append(tags.get("amenity"))
+    return " ".join([p for p in parts if p]).strip()
+
+
+# ---------------- enrichment ----------------
+# Lookups for the top N elements run concurrently, bounded by a semaphore; each element gets its
+# own deadline so one slow lookup cannot hold up the whole response.
+ENRICH_CONCURRENCY = int(os.environ.get("GMAPS_ENRICH_CONCURRENCY", "8"))
+ENRICH_DEADLINE_S = float(os.environ.get("GMAPS_ENRICH_DEADLINE_S", "8"))
+
+
+def parse_field_groups(fields: str, reviews_n: int) -> Tuple[str, ...]:
+    """
+    Validated field groups for the Place Details lookup; skip reviews nobody will see.
+    Raises ValueError for unknown groups.
+    """
+    groups = normalize_field_groups(fields)
+    if reviews_n <= 0 and len(groups) > 1:
+        groups = tuple(g for g in groups if g != "reviews")
+    return groups
+
+
+async def enrich_element(
+    el: Dict[str, Any], reviews_n: int, deadline_s: float, field_groups: Optional[Tuple[str, ...]] = None
+) -> Dict[str, Any]:
+    """Look up one Overpass element on Google Maps and return its concise summary dict."""
+    el_latlon = get_latlon_from_element(el)
+    tags = el.get("tags", {}) or {}
+    # skip elements without coords
+    if not el_latlon:
+        return {
+            "element_id": el.get("id"),
+            "osm_type": el.get("type"),
+            "skipped": True,
+            "reason": "no lat/lon or center available in element",
+        }
+
+    search_name = _build_search_name(tags)
+    if not search_name:
+        search_name = tags.get("amenity", "")
+
+    not_found = {
+        "element_id": el.get("id"),
+        "osm_type": el.get("type"),
+        "name": search_name,
+        "lat": el_latlon["lat"],
+        "lon": el_latlon["lon"],
+        "rating": None,
+        "reviews": [],
+        "found_on_gmaps": False,
+    }
+
+    try:
+        details = await asyncio.wait_for(
+            call_gmaps_async(
+                search_name, el_latlon["lat"], el_latlon["lon"], radius=100,
+                osm_type=el.get("type"), osm_id=el.get("id"), field_groups=field_groups,
+            ),
+            timeout=deadline_s,
+        )
+    except asyncio.TimeoutError:
+        logging.warning("Google Maps lookup for element %s exceeded %.1fs", el.get("id"), deadline_s)
+        return {**not_found, "error": f"Google Maps lookup timed out after {deadline_s}s"}
+    except Exception as e:
+        logging.exception("Google Maps lookup failed for element %s", el.get("id"))
+        return {**not_found, "error": str(e)}
+
+    if details is None:
+        # not found on Google Maps (an empty dict is a place without the requested fields)
+        return not_found
+
+    extracted_reviews = []
+    for rev in (details.get("reviews") or [])[:reviews_n]:
+        extracted_reviews.append({
+            "author_name": rev.get("author_name"),
+            "author_url": rev.get("author_url"),
+            "rating": rev.get("rating"),
+            "relative_time_description": rev.get("relative_time_description"),
+            "time": rev.get("time"),
+            "text": rev.get("text"),
+        })
+
+    return {
+        "element_id": el.get("id"),
+        "osm_type": el.get("type"),
+        "name": details.get("name") or search_name,
+        "lat": el_latlon["lat"],
+        "lon": el_latlon["lon"],
+        "rating": details.get("rating"),
+        "reviews": extracted_reviews,
+        "found_on_gmaps": True,
+    }
+
+
+async def enrich_elements(
+    elements: List[Dict[str, Any]],
+    reviews_n: int,
+    concurrency: int = ENRICH_CONCURRENCY,
+    deadline_s: float = ENRICH_DEADLINE_S,
+    field_groups: Optional[Tuple[str, ...]] = None,
+) -> List[Dict[str, Any]]:
+    """Enrich `elements` concurrently (at most `concurrency` lookups at a time), in input order."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(el: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await enrich_element(el, reviews_n, deadline_s, field_groups)
+
+    return list(await asyncio.gather(*(bounded(el) for el in elements)))
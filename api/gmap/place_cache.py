@@ -0,0 +1,317 @@
+# api/gmap/place_cache.py
+"""
+Persistent (SQLite) caches in front of the Google Places API.
+
+place_id mapping: every /search/gmap enrichment starts with a Nearby Search to turn an Overpass
+element into a place_id, and rooms searching the same area repeat those lookups for the same
+elements. Results are stored under two keys so repeat lookups skip Nearby Search:
+  - the OSM identity, "osm:<type>/<id>", when the caller knows it;
+  - the normalized search name plus location quantized to ~11 m and the search radius.
+ZERO_RESULTS answers are cached too (place_id NULL) with a shorter TTL, since a missing listing
+may be added to Google later. Other error statuses are never cached.
+
+Place details: stored per (place_id, field group) so each group has its own TTL (names and
+addresses barely change, ratings drift daily). Entries past their TTL stay usable for a grace
+period: callers serve them immediately and refresh them in the background (stale-while-revalidate).
+"""
+
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DAY = 24 * 3600
+
+# Location quantization for the name+location key (4 decimals is ~11 m of latitude).
+LOCATION_DECIMALS = 4
+
+# Google allows place_ids to be stored indefinitely; refresh them monthly anyway.
+PLACE_ID_TTL_SECONDS = int(os.environ.get("PLACE_ID_TTL", str(30 * DAY)))
+NEGATIVE_TTL_SECONDS = int(os.environ.get("PLACE_ID_NEGATIVE_TTL", str(DAY)))
+
+# Place Details fields by group; callers ask for groups (a field mask), never single fields.
+FIELD_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "basic": ("name", "formatted_address"),
+    "rating": ("rating", "user_ratings_total"),
+    "reviews": ("reviews",),
+}
+GROUP_TTL_SECONDS: Dict[str, int] = {
+    "basic": 30 * DAY,
+    "rating": DAY,
+    "reviews": 3 * DAY,
+}
+# How long past its TTL an entry may still be served while it is refreshed in the background.
+STALE_GRACE_SECONDS = int(os.environ.get("PLACE_DETAILS_STALE_GRACE", str(7 * DAY)))
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "durhack_cache", "place_cache.sqlite3")
+
+
+# ---------------- keys ----------------
+def osm_key(osm_type: Optional[str], osm_id: Optional[int]) -> Optional[str]:
+    if not osm_type or osm_id is None:
+        return None
+    return f"osm:{osm_type}/{osm_id}"
+
+
+def location_key(name: str, lat: float, lng: float, radius: int) -> str:
+    normalized = re.sub(r"\s+", " ", (name or "").strip().lower())
+    return f"loc:{normalized}|{round(float(lat), LOCATION_DECIMALS)}|{round(float(lng), LOCATION_DECIMALS)}|{int(radius)}"
+
+
+def _keys(
+    name: str, lat: float, lng: float, radius: int, osm_type: Optional[str], osm_id: Optional[int]
+) -> List[str]:
+    keys = [location_key(name, lat, lng, radius)]
+    by_osm = osm_key(osm_type, osm_id)
+    if by_osm:
+        keys.insert(0, by_osm)
+    return keys
+
+
+def normalize_field_groups(groups: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    """
+    Field groups in canonical order. Accepts an iterable or a comma-separated string; None or
+    empty means every group. Raises ValueError for unknown group names.
+    """
+    if groups is None:
+        return tuple(FIELD_GROUPS)
+    if isinstance(groups, str):
+        groups = groups.split(",")
+    wanted = {g.strip().lower() for g in groups if g and g.strip()}
+    unknown = wanted - set(FIELD_GROUPS)
+    if unknown:
+        raise ValueError(f"Unknown field group(s): {', '.join(sorted(unknown))} (expected {', '.join(FIELD_GROUPS)})")
+    return tuple(g for g in FIELD_GROUPS if g in wanted) or tuple(FIELD_GROUPS)
+
+
+def fields_for_groups(groups: Iterable[str]) -> str:
+    """Place Details `fields` parameter for the given groups."""
+    return ",".join(f for g in groups for f in FIELD_GROUPS[g])
+
+
+# ---------------- SQLite stores ----------------
+class PlaceIdCache:
+    """
+    SQLite-backed place_id mapping with TTL expiry and LRU eviction.
+
+    A new connection is opened per operation so the cache can be used from worker threads
+    (callers in async code should go through asyncio.to_thread).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.environ.get("PLACE_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("PLACE_ID_CACHE_MAX_ENTRIES", "50000"))
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS place_id_map (
+                    key TEXT PRIMARY KEY,
+                    place_id TEXT,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_place_id_map_access ON place_id_map (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def lookup(
+        self,
+        name: str,
+        lat: float,
+        lng: float,
+        radius: int = 100,
+        osm_type: Optional[str] = None,
+        osm_id: Optional[int] = None,
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Return (hit, place_id). A hit with place_id None is a cached ZERO_RESULTS answer.
+        The OSM key is tried before the name+location key.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for key in _keys(name, lat, lng, radius, osm_type, osm_id):
+                row = conn.execute(
+                    "SELECT place_id FROM place_id_map WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE place_id_map SET last_access = ? WHERE key = ?", (now, key))
+                    return True, row[0]
+        return False, None
+
+    def put(
+        self,
+        name: str,
+        lat: float,
+        lng: float,
+        radius: int,
+        place_id: Optional[str],
+        osm_type: Optional[str] = None,
+        osm_id: Optional[int] = None,
+    ) -> None:
+        """Store a place_id (or None for ZERO_RESULTS) under every key the lookup can use."""
+        now = time.time()
+        ttl = PLACE_ID_TTL_SECONDS if place_id else NEGATIVE_TTL_SECONDS
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO place_id_map (key, place_id, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                [(key, place_id, now + ttl, now) for key in _keys(name, lat, lng, radius, osm_type, osm_id)],
+            )
+            conn.execute("DELETE FROM place_id_map WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM place_id_map WHERE key IN (
+                    SELECT key FROM place_id_map ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def invalidate(
+        self,
+        name: str,
+        lat: float,
+        lng: float,
+        radius: int = 100,
+        osm_type: Optional[str] = None,
+        osm_id: Optional[int] = None,
+    ) -> None:
+        """Forget the mapping under every key the lookup can use (e.g. Google retired the place_id)."""
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM place_id_map WHERE key = ?",
+                [(key,) for key in _keys(name, lat, lng, radius, osm_type, osm_id)],
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM place_id_map")
+
+
+class PlaceDetailsCache:
+    """
+    Place Details per (place_id, field group), with per-group TTLs, a stale grace period and
+    LRU eviction. Same threading rules as PlaceIdCache.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.environ.get("PLACE_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("PLACE_DETAILS_CACHE_MAX_ENTRIES", "50000"))
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS place_details (
+                    place_id TEXT NOT NULL,
+                    field_group TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    fresh_until REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (place_id, field_group)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_place_details_access ON place_details (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, place_id: str, groups: Iterable[str]) -> Dict[str, Tuple[Dict[str, Any], bool]]:
+        """Usable cached groups as {group: (fields, is_fresh)}; missing/expired groups are absent."""
+        groups = list(groups)
+        if not groups:
+            return {}
+        now = time.time()
+        marks = ",".join("?" for _ in groups)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT field_group, data, fresh_until FROM place_details
+                WHERE place_id = ? AND field_group IN ({marks}) AND expires_at > ?
+                """,
+                (place_id, *groups, now),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE place_details SET last_access = ? WHERE place_id = ? AND field_group = ?",
+                [(now, place_id, group) for group, _, _ in rows],
+            )
+        return {group: (json.loads(data), fresh_until > now) for group, data, fresh_until in rows}
+
+    def put(self, place_id: str, result: Dict[str, Any], groups: Iterable[str]) -> None:
+        """Store the fields of `result` belonging to each of `groups` (absent fields are stored as absent)."""
+        now = time.time()
+        rows = []
+        for group in groups:
+            data = {f: result[f] for f in FIELD_GROUPS[group] if f in result}
+            fresh_until = now + GROUP_TTL_SECONDS[group]
+            rows.append((place_id, group, json.dumps(data, separators=(",", ":")), fresh_until,
+                         fresh_until + STALE_GRACE_SECONDS, now))
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO place_details
+                    (place_id, field_group, data, fresh_until, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            conn.execute("DELETE FROM place_details WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM place_details WHERE rowid IN (
+                    SELECT rowid FROM place_details ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM place_details")
+
+
+_PLACE_ID_CACHE: Optional[PlaceIdCache] = None
+_DETAILS_CACHE: Optional[PlaceDetailsCache] = None
+
+
+def get_place_id_cache() -> PlaceIdCache:
+    """Return the process-wide PlaceIdCache (created on first use)."""
+    global _PLACE_ID_CACHE
+    if _PLACE_ID_CACHE is None:
+        _PLACE_ID_CACHE = PlaceIdCache()
+    return _PLACE_ID_CACHE
+
+
+def get_place_details_cache() -> PlaceDetailsCache:
+    """Return the process-wide PlaceDetailsCache (created on first use)."""
+    global _DETAILS_CACHE
+    if _DETAILS_CACHE is None:
+        _DETAILS_CACHE = PlaceDetailsCache()
+    return _DETAILS_CACHE
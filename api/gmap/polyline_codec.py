@@ -0,0 +1,61 @@
+# api/gmap/polyline_codec.py
+"""
+Route geometry helpers: a vectorized (NumPy) decoder for Google encoded polylines and
+zoom-dependent simplification.
+
+A long driving route is an encoded string of a few kilobytes but thousands of points once
+decoded; `polyline.decode` walks it character by character in Python. `decode_polyline` does
+the same work with array operations. `simplify_for_zoom` drops points that would be closer than
+about a pixel apart at a given web-map zoom level.
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+import polyline
+
+from api.map.geometry import simplify_line
+
+# Web Mercator ground resolution at zoom 0 on the equator (metres per 256 px tile pixel).
+_METRES_PER_PIXEL_Z0 = 156_543.03392
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> np.ndarray:
+    """Decode a Google encoded polyline into an (N, 2) array of (lat, lng)."""
+    if not encoded:
+        return np.empty((0, 2))
+    chars = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if chars.min() < 0 or chars.max() > 63:
+        raise ValueError("Invalid character in encoded polyline")
+    # each value is a run of 5-bit groups, little-endian; bit 0x20 means "more groups follow"
+    ends = (chars & 0x20) == 0
+    if not ends[-1]:
+        raise ValueError("Encoded polyline ends in the middle of a value")
+    starts = np.flatnonzero(np.concatenate([[True], ends[:-1]]))
+    value_index = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(chars))))
+    shifts = 5 * (np.arange(len(chars)) - starts[value_index])
+    values = np.add.reduceat((chars & 0x1F) << shifts, starts)
+    if len(values) % 2:
+        raise ValueError("Encoded polyline has an odd number of values")
+    # zig-zag decoding of the signed deltas, then a running sum per coordinate
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10.0 ** precision
+
+
+def encode_polyline(coords: np.ndarray, precision: int = 5) -> str:
+    """Encode (lat, lng) points as a Google polyline."""
+    return polyline.encode([(float(lat), float(lng)) for lat, lng in coords], precision)
+
+
+def metres_per_pixel(zoom: float, lat: float) -> float:
+    """Ground size of one map pixel at `zoom` and latitude `lat` (Web Mercator, 256 px tiles)."""
+    return _METRES_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def simplify_for_zoom(coords: np.ndarray, zoom: Optional[float], pixels: float = 1.0) -> np.ndarray:
+    """Simplify a route so no detail smaller than `pixels` at `zoom` is kept (None: unchanged)."""
+    if zoom is None or len(coords) <= 2:
+        return coords
+    tolerance_m = pixels * metres_per_pixel(zoom, float(coords[:, 0].mean()))
+    return simplify_line(coords, tolerance_m)
@@ -0,0 +1,148 @@
+# api/gmap/route_cache.py
+"""
+Persistent (SQLite) cache for Google Directions results.
+
+Everyone on a result page asks for nearly the same route to the winning venue, from origins a
+few metres apart. Entries are keyed by origin and destination snapped to a ROUTE_GRID_M grid
+(default 50 m) plus the travel mode and whether alternatives were asked for, so those requests
+share one Directions call. Only the compact part of the answer is stored: per route the encoded
+overview polyline, distance, duration and summary. ZERO_RESULTS/NOT_FOUND answers are cached for
+a shorter TTL; other error statuses are never cached.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+ROUTE_GRID_M = float(os.environ.get("ROUTE_GRID_M", "50"))
+# Routes are requested without departure_time, so they do not depend on live traffic.
+ROUTE_TTL_SECONDS = int(os.environ.get("ROUTE_CACHE_TTL", str(7 * DAY)))
+NEGATIVE_TTL_SECONDS = int(os.environ.get("ROUTE_CACHE_NEGATIVE_TTL", str(HOUR)))
+
+# Directions statuses that describe the route itself (not a quota/transient problem).
+CACHEABLE_STATUSES = {"OK", "ZERO_RESULTS", "NOT_FOUND"}
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "durhack_cache", "route_cache.sqlite3")
+
+_METRES_PER_DEGREE = 111_320.0
+
+
+# ---------------- keys ----------------
+def snap_to_grid(lat: float, lng: float, grid_m: float = ROUTE_GRID_M) -> Tuple[int, int]:
+    """Grid cell of a point: rows are grid_m of latitude, columns grid_m of longitude at that row."""
+    row = math.floor(lat * _METRES_PER_DEGREE / grid_m)
+    row_lat = (row + 0.5) * grid_m / _METRES_PER_DEGREE
+    metres_per_lng = _METRES_PER_DEGREE * max(math.cos(math.radians(row_lat)), 1e-6)
+    return row, math.floor(lng * metres_per_lng / grid_m)
+
+
+def route_key(
+    origin: Tuple[float, float],
+    destination: Tuple[float, float],
+    travel_mode: str,
+    alternatives: bool = False,
+    grid_m: float = ROUTE_GRID_M,
+) -> str:
+    o = snap_to_grid(origin[0], origin[1], grid_m)
+    d = snap_to_grid(destination[0], destination[1], grid_m)
+    key = f"{travel_mode.lower()}|{grid_m:g}|{o[0]},{o[1]}|{d[0]},{d[1]}"
+    return key + "|alt" if alternatives else key
+
+
+# ---------------- SQLite store ----------------
+class RouteCache:
+    """
+    SQLite-backed route cache with TTL expiry and LRU eviction.
+
+    A new connection is opened per operation so the cache can be used from worker threads
+    (callers in async code should go through asyncio.to_thread).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.environ.get("ROUTE_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("ROUTE_CACHE_MAX_ENTRIES", "20000"))
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS directions_cache (
+                    key TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    routes TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_directions_cache_access ON directions_cache (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """Return (status, routes) for a live entry, or None."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, routes FROM directions_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE directions_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, status: str, routes: List[Dict[str, Any]]) -> None:
+        if status not in CACHEABLE_STATUSES:
+            return
+        now = time.time()
+        ttl = ROUTE_TTL_SECONDS if status == "OK" else NEGATIVE_TTL_SECONDS
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO directions_cache (key, status, routes, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, status, json.dumps(routes, separators=(",", ":")), now + ttl, now),
+            )
+            conn.execute("DELETE FROM directions_cache WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM directions_cache WHERE key IN (
+                    SELECT key FROM directions_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM directions_cache")
+
+
+_ROUTE_CACHE: Optional[RouteCache] = None
+
+
+def get_route_cache() -> RouteCache:
+    """Return the process-wide RouteCache (created on first use)."""
+    global _ROUTE_CACHE
+    if _ROUTE_CACHE is None:
+        _ROUTE_CACHE = RouteCache()
+    return _ROUTE_CACHE
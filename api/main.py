@@ -12,6 +12,8 @@ from api.routers.map.overpass_routers import router as overpass_router
 from api.routers.gmap.gmaps_routers import router as gmaps_router
 from api.routers.gmap.gmaps_directions_router import router as gmaps_directions_router
 from api.routers.gemini.gemini_router import router as gemini_router
+from api.routers.rooms.rooms_router import router as rooms_router
+from api.common.http_client import get_http_client
 
 # optional supabase client usage (keep as you had)
 try:
@@ -32,6 +34,19 @@ app.include_router(overpass_router, prefix="/api/map", tags=["map"])
 app.include_router(gmaps_router, prefix="/api/gmap", tags=["gmap"])
 app.include_router(gmaps_directions_router, prefix="/api/gmap", tags=["gmap-directions"])
 app.include_router(gemini_router, prefix="/api/gemini", tags=["gemini"])
+app.include_router(rooms_router, prefix="/api/rooms", tags=["rooms"])
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    # release pooled keep-alive connections to upstream services
+    await get_http_client().aclose()
+
+
+@app.get("/api/metrics/upstreams")
+def upstream_metrics():
+    # per-upstream request/error/retry counters and latency percentiles, plus the retry budget
+    return get_http_client().stats()
 
 # CORS for local dev; tighten for production
 # Prefer to declare your allowed origins in env var; fallback to common dev origin
@@ -0,0 +1,220 @@
+# api/map/geometry.py
+"""
+Polygon helpers used to answer searches locally from cached Overpass results:
+vectorized point-in-polygon tests (NumPy) and polygon set operations (shapely).
+
+Polygons are lists of (lat, lon) tuples as returned by extract_polygons_from_frontend_json.
+Coordinates are treated as planar (lon = x, lat = y), which is accurate enough for
+the city-sized areas users draw.
+"""
+
+import math
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from shapely.geometry import LineString, Polygon
+from shapely.geometry.base import BaseGeometry
+from shapely.validation import make_valid
+
+from api.map.leaflet_to_overpass import get_latlon_from_element
+
+
+def _as_ring(polygon: List[Tuple[float, float]]) -> np.ndarray:
+    """Return an (N, 2) array of (lat, lon) with the closing vertex removed."""
+    ring = np.asarray(polygon, dtype=float).reshape(-1, 2)
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    return ring
+
+
+def points_in_polygon(lats: np.ndarray, lons: np.ndarray, polygon: List[Tuple[float, float]]) -> np.ndarray:
+    """
+    Ray-casting point-in-polygon test for many points at once.
+    Returns a boolean array with True for points inside `polygon`.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    ring = _as_ring(polygon)
+    inside = np.zeros(lats.shape, dtype=bool)
+    if len(ring) < 3 or lats.size == 0:
+        return inside
+
+    y1, x1 = ring[:, 0], ring[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+
+    # Loop over edges, vectorize over points (edges are few, points are many).
+    for ay, ax, by, bx in zip(y1, x1, y2, x2):
+        crosses = (ay > lats) != (by > lats)
+        if not crosses.any():
+            continue
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_at = ax + (lats - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (lons < x_at)
+    return inside
+
+
+def _segments_properly_intersect(a: np.ndarray, b: np.ndarray) -> bool:
+    """
+    True if any segment of ring `a` crosses any segment of ring `b` (touching endpoints and
+    collinear overlaps are not counted). Rings are (N, 2) arrays; all pairs are tested at once.
+    """
+    p1, p2 = a[:, None, :], np.roll(a, -1, axis=0)[:, None, :]
+    q1, q2 = b[None, :, :], np.roll(b, -1, axis=0)[None, :, :]
+
+    def orient(o, p, q):
+        return (p[..., 0] - o[..., 0]) * (q[..., 1] - o[..., 1]) - (p[..., 1] - o[..., 1]) * (q[..., 0] - o[..., 0])
+
+    d1 = orient(p1, p2, q1)
+    d2 = orient(p1, p2, q2)
+    d3 = orient(q1, q2, p1)
+    d4 = orient(q1, q2, p2)
+    return bool(np.any((d1 * d2 < 0) & (d3 * d4 < 0)))
+
+
+def polygon_contains_polygon(outer: List[Tuple[float, float]], inner: List[Tuple[float, float]]) -> bool:
+    """
+    True if `inner` lies entirely within `outer`: every inner vertex is inside outer and
+    no edges cross (needed for concave outer polygons).
+    """
+    outer_ring = _as_ring(outer)
+    inner_ring = _as_ring(inner)
+    if len(outer_ring) < 3 or len(inner_ring) < 3:
+        return False
+    if not points_in_polygon(inner_ring[:, 0], inner_ring[:, 1], outer).all():
+        return False
+    return not _segments_properly_intersect(outer_ring, inner_ring)
+
+
+def element_coordinates(elements: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return (lats, lons, has_coords) arrays for Overpass elements, using node lat/lon or
+    way/relation center. Elements without coordinates get NaN and has_coords=False.
+    """
+    lats = np.full(len(elements), np.nan)
+    lons = np.full(len(elements), np.nan)
+    for i, el in enumerate(elements):
+        latlon = get_latlon_from_element(el)
+        if latlon:
+            lats[i] = latlon["lat"]
+            lons[i] = latlon["lon"]
+    return lats, lons, ~np.isnan(lats)
+
+
+def filter_elements_in_polygon(elements: List[Dict[str, Any]], polygon: List[Tuple[float, float]]) -> List[Dict[str, Any]]:
+    """Keep the elements whose point (or center) falls inside `polygon`, preserving order."""
+    if not elements:
+        return []
+    lats, lons, has_coords = element_coordinates(elements)
+    mask = np.zeros(len(elements), dtype=bool)
+    mask[has_coords] = points_in_polygon(lats[has_coords], lons[has_coords], polygon)
+    return [el for el, keep in zip(elements, mask) if keep]
+
+
+# ---------------- simplification ----------------
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def _project_to_metres(ring: np.ndarray) -> np.ndarray:
+    """Equirectangular projection of (lat, lon) around the ring's mean latitude -> (x, y) metres."""
+    lat0 = math.radians(float(ring[:, 0].mean()))
+    x = np.radians(ring[:, 1]) * math.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(ring[:, 0]) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+def _visvalingam_keep(xy: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Visvalingam-Whyatt on a closed ring: repeatedly drop the vertex whose triangle with its
+    neighbours has the smallest area, until every remaining triangle is >= tolerance_m^2.
+    Returns a boolean keep-mask.
+    """
+    n = len(xy)
+    keep = np.ones(n, dtype=bool)
+    threshold = tolerance_m * tolerance_m
+    idx = list(range(n))
+    while len(idx) > 3:
+        pts = xy[idx]
+        prev_pts, next_pts = np.roll(pts, 1, axis=0), np.roll(pts, -1, axis=0)
+        areas = 0.5 * np.abs(
+            (prev_pts[:, 0] - pts[:, 0]) * (next_pts[:, 1] - pts[:, 1])
+            - (next_pts[:, 0] - pts[:, 0]) * (prev_pts[:, 1] - pts[:, 1])
+        )
+        smallest = int(np.argmin(areas))
+        if areas[smallest] >= threshold:
+            break
+        keep[idx.pop(smallest)] = False
+    return keep
+
+
+def simplify_polygon(
+    polygon: List[Tuple[float, float]],
+    tolerance_m: float,
+    method: str = "dp",
+) -> List[Tuple[float, float]]:
+    """
+    Reduce the vertex count of a (lat, lon) polygon while keeping its outline within roughly
+    `tolerance_m` metres. `method` is "dp" (Douglas-Peucker) or "vw" (Visvalingam-Whyatt).
+    Returns the input unchanged if tolerance_m <= 0 or simplification would degenerate it.
+    """
+    ring = _as_ring(polygon)
+    if tolerance_m <= 0 or len(ring) <= 4:
+        return list(polygon)
+    xy = _project_to_metres(ring)
+
+    if method == "vw":
+        keep = _visvalingam_keep(xy, tolerance_m)
+    else:
+        # Douglas-Peucker on the closed line; shapely returns a subset of the input vertices.
+        closed = np.vstack([xy, xy[:1]])
+        simplified = np.asarray(LineString(closed).simplify(tolerance_m, preserve_topology=True).coords)[:-1]
+        kept = {tuple(p) for p in simplified}
+        keep = np.array([tuple(p) in kept for p in xy])
+
+    if keep.sum() < 3:
+        return list(polygon)
+    return [(float(lat), float(lon)) for lat, lon in ring[keep]]
+
+
+def simplify_line(points: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Douglas-Peucker on an open (lat, lon) line, e.g. a route, keeping it within roughly
+    `tolerance_m` metres. Returns a subset of the input rows (endpoints always kept).
+    """
+    points = np.asarray(points, dtype=float)
+    if tolerance_m <= 0 or len(points) <= 2:
+        return points
+    xy = _project_to_metres(points)
+    simplified = np.asarray(LineString(xy).simplify(tolerance_m, preserve_topology=False).coords)
+    kept = {tuple(p) for p in simplified}
+    keep = np.array([tuple(p) in kept for p in xy])
+    keep[0] = keep[-1] = True
+    return points[keep]
+
+
+def polygons_bbox(polygons: List[List[Tuple[float, float]]]) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) bounding box of one or more (lat, lon) polygons."""
+    lats = [lat for polygon in polygons for lat, _ in polygon]
+    lons = [lon for polygon in polygons for _, lon in polygon]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+# ---------------- shapely helpers (polygon set operations) ----------------
+def to_shape(polygon: List[Tuple[float, float]]) -> BaseGeometry:
+    """(lat, lon) polygon -> valid shapely geometry in (x=lon, y=lat) order."""
+    shape = Polygon([(lon, lat) for lat, lon in _as_ring(polygon)])
+    return shape if shape.is_valid else make_valid(shape)
+
+
+def shape_to_polygons(shape: BaseGeometry, min_area: float = 0.0) -> List[List[Tuple[float, float]]]:
+    """
+    Flatten a shapely geometry into (lat, lon) polygons (exterior rings only; holes are dropped,
+    so callers must clip results afterwards). Pieces with area <= min_area are skipped.
+    """
+    parts = getattr(shape, "geoms", [shape])
+    polygons = []
+    for part in parts:
+        if isinstance(part, Polygon) and not part.is_empty and part.area > min_area:
+            polygons.append([(lat, lon) for lon, lat in part.exterior.coords])
+        elif hasattr(part, "geoms"):
+            polygons.extend(shape_to_polygons(part, min_area))
+    return polygons
@@ -3,11 +3,16 @@
 Utilities to parse Leaflet-style latlng JSON and query Overpass API.
 """
 
-from typing import List, Tuple, Dict, Any, Union
-import requests
+import re
+from typing import List, Tuple, Dict, Any, Optional, Union
 
-# Overpass API endpoint (public). You can change to any Overpass instance if needed.
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+from api.common.singleflight import SingleFlight
+from api.map.overpass_client import DEFAULT_OVERPASS_URLS, get_overpass_client
+
+# Primary Overpass API endpoint (public). Mirrors are configured via OVERPASS_URLS, see overpass_client.
+OVERPASS_URL = DEFAULT_OVERPASS_URLS[0]
+
+OVERPASS_FLIGHT = SingleFlight("overpass")
 
 
 def extract_polygons_from_frontend_json(data: List[Dict[str, Any]]) -> List[List[Tuple[float, float]]]:
@@ -62,6 +67,20 @@ def extract_polygons_from_frontend_json(data: List[Dict[str, Any]]) -> List[List
     return polygons
 
 
+def get_latlon_from_element(el: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """
+    Extract latitude/longitude from an Overpass element.
+    Nodes have 'lat' and 'lon'. Ways/relations (when 'out center') have 'center': {'lat','lon'}.
+    Returns dict {'lat': float, 'lon': float} or None if not available.
+    """
+    if el.get("lat") is not None and el.get("lon") is not None:
+        return {"lat": float(el["lat"]), "lon": float(el["lon"])}
+    center = el.get("center")
+    if isinstance(center, dict) and center.get("lat") is not None and center.get("lon") is not None:
+        return {"lat": float(center["lat"]), "lon": float(center["lon"])}
+    return None
+
+
 def polygon_to_overpass_poly_string(polygon: List[Tuple[float, float]]) -> str:
     """
     Convert polygon list of (lat, lon) to Overpass 'poly' string format:
@@ -79,6 +98,32 @@ def polygon_to_overpass_poly_string(polygon: List[Tuple[float, float]]) -> str:
     return " ".join(parts)
 
 
+def normalize_amenity_filters(amenity: Union[str, List[str]]) -> List[str]:
+    """
+    Normalize an amenity parameter into a list of key/value strings like "amenity=bar".
+    Accepts "restaurant", "amenity=restaurant", or a list mixing both forms.
+    """
+    if isinstance(amenity, str):
+        # If user passed "amenity=bar" keep it; if just "bar", prepend "amenity="
+        if "=" in amenity:
+            return [amenity]
+        return [f"amenity={amenity}"]
+
+    # amenity is list
+    amen_list = []
+    for a in amenity:
+        if not isinstance(a, str):
+            continue
+        a = a.strip()
+        if not a:
+            continue
+        if "=" in a:
+            amen_list.append(a)
+        else:
+            amen_list.append(f"amenity={a}")
+    return amen_list
+
+
 def build_overpass_query(poly_string: str, amenity: Union[str, List[str]] = "restaurant", timeout: int = 25) -> str:
     """
     Build an Overpass QL query returning nodes, ways, relations for one or multiple amenity values.
@@ -93,26 +138,7 @@ def build_overpass_query(poly_string: str, amenity: Union[str, List[str]] = "res
         );
         out center;
     """
-    # Normalize amenity parameter into list of key/value strings like amenity=bar
-    if isinstance(amenity, str):
-        # If user passed "amenity=bar" keep it; if just "bar", prepend "amenity="
-        if "=" in amenity:
-            amen_list = [amenity]
-        else:
-            amen_list = [f"amenity={amenity}"]
-    else:
-        # amenity is list
-        amen_list = []
-        for a in amenity:
-            if not isinstance(a, str):
-                continue
-            a = a.strip()
-            if not a:
-                continue
-            if "=" in a:
-                amen_list.append(a)
-            else:
-                amen_list.append(f"amenity={a}")
+    amen_list = normalize_amenity_filters(amenity)
 
     # Build the union clause with node/way/relation for each amenity
     clauses = []
@@ -140,10 +166,108 @@ out center;
     return q.strip()
 
 
-def query_overpass(overpass_query: str) -> Dict[str, Any]:
+def build_overpass_query_for_amenities(poly_str: str, amenity_values: List[str], timeout: int = 25) -> str:
+    """
+    Build an Overpass QL query that matches nodes/ways/relations with amenity in amenity_values
+    using a regex on the amenity tag. amenity_values should be just the right-hand side values
+    (e.g. ["cafe", "restaurant"]) NOT including "amenity=" prefix.
+    """
+    if not amenity_values:
+        raise ValueError("amenity_values must be non-empty")
+
+    # escape values for regex
+    escaped = [re.escape(v) for v in amenity_values]
+    pattern = "^(" + "|".join(escaped) + ")$"
+
+    q_parts = [
+        f'[out:json][timeout:{timeout}];',
+        '(',
+        f'  node["amenity"~"{pattern}"](poly:"{poly_str}");',
+        f'  way["amenity"~"{pattern}"](poly:"{poly_str}");',
+        f'  relation["amenity"~"{pattern}"](poly:"{poly_str}");',
+        ');',
+        'out center;'
+    ]
+    return "\n".join(q_parts)
+
+
+def _amenity_selectors(amenity_filters: List[str]) -> List[str]:
+    """
+    Turn normalized "key=value" filters into Overpass tag selectors. Several plain amenity
+    filters collapse into a single regex selector; anything else gets one selector per filter.
+    """
+    if len(amenity_filters) > 1 and all(a.startswith("amenity=") for a in amenity_filters):
+        escaped = [re.escape(a.split("=", 1)[1].strip()) for a in amenity_filters]
+        return ['["amenity"~"^(' + "|".join(escaped) + ')$"]']
+    selectors = []
+    for a in amenity_filters:
+        k, v = a.split("=", 1) if "=" in a else ("amenity", a)
+        selectors.append(f'["{k.strip()}"="{v.strip()}"]')
+    return selectors
+
+
+def build_overpass_union_query(
+    poly_strings: List[str],
+    amenity_filters: List[str],
+    timeout: int = 25,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    limit: Optional[int] = None,
+) -> str:
+    """
+    Build one Overpass union over several polygons (poly strings) for normalized "key=value"
+    amenity filters, so multiple areas are fetched in a single round trip.
+
+    Uses `nwr` so each poly string appears once per selector rather than once per element type.
+    If `bbox` (south, west, north, east) is given it is set as the global [bbox:...], letting
+    Overpass discard everything outside it before the (more expensive) polygon test.
+    `limit` caps the number of elements Overpass outputs.
+    """
+    selectors = _amenity_selectors(amenity_filters)
+    if not selectors or not poly_strings:
+        raise ValueError("poly_strings and amenity_filters must be non-empty")
+
+    clauses = []
+    for poly_str in poly_strings:
+        for sel in selectors:
+            clauses.append(f'  nwr{sel}(poly:"{poly_str}");')
+
+    settings = f'[out:json][timeout:{timeout}]'
+    if bbox is not None:
+        south, west, north, east = bbox
+        settings += f'[bbox:{south},{west},{north},{east}]'
+    out = f'out center {int(limit)};' if limit else 'out center;'
+    q_parts = [settings + ';', '(', *clauses, ');', out]
+    return "\n".join(q_parts)
+
+
+def build_overpass_bbox_query(
+    bbox_filters: List[Tuple[Tuple[float, float, float, float], List[str]]],
+    timeout: int = 25,
+) -> str:
+    """
+    Build one Overpass union over several bounding boxes, each with its own normalized
+    "key=value" filters: [((south, west, north, east), ["amenity=cafe", ...]), ...].
+    Used to fetch cache tiles. Output is `out tags center bb`: tags, center and `bounds` only (no
+    node lists), the bounds letting the tile cache file ways and relations under every tile they
+    overlap.
+    """
+    clauses = []
+    for (south, west, north, east), amenity_filters in bbox_filters:
+        for sel in _amenity_selectors(amenity_filters):
+            clauses.append(f'  nwr{sel}({south},{west},{north},{east});')
+    if not clauses:
+        raise ValueError("bbox_filters must contain at least one bbox with filters")
+    q_parts = [f'[out:json][timeout:{timeout}];', '(', *clauses, ');', 'out tags center bb;']
+    return "\n".join(q_parts)
+
+
+async def query_overpass(overpass_query: str) -> Dict[str, Any]:
     """
-    Send an Overpass query and return parsed JSON. Raises requests.HTTPError on bad HTTP responses.
+    Send an Overpass query and return parsed JSON.
+    Uses the shared async client (pooled connections, mirror failover, hedged requests);
+    concurrent calls with the same query text are coalesced into one request.
+    Raises httpx.HTTPStatusError on bad HTTP responses and OverpassUnavailableError when
+    every mirror is busy or unreachable.
     """
-    resp = requests.post(OVERPASS_URL, data={"data": overpass_query}, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
+    # identical queries already in flight share the upstream call
+    return await OVERPASS_FLIGHT.do(overpass_query, lambda: get_overpass_client().query(overpass_query))
@@ -0,0 +1,297 @@
+# api/map/overpass_cache.py
+"""
+Persistent (SQLite) cache for Overpass search results.
+
+Entries are keyed by a canonical form of the search, not by the raw Overpass QL text:
+  - polygon vertices quantized to ~1e-5 degrees (about 1 m), closing vertex dropped,
+    rotated to start at the smallest vertex and oriented counter-clockwise;
+  - amenity filters normalized to "key=value", de-duplicated and sorted;
+  - timeout and other query settings ignored.
+Each entry gets a TTL based on the amenity classes it covers and the table is trimmed to
+`max_entries` rows by least-recent access (LRU).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from api.map.geometry import polygon_contains_polygon
+
+# Vertex quantization step in degrees (~1.1 m of latitude).
+QUANTIZE_DECIMALS = 5
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Amenity classes and how long their results stay valid. Restaurants and bars open/close over
+# months; markets and vending/rental points move or change far more often.
+AMENITY_CLASSES: Dict[str, set] = {
+    "food_drink": {
+        "restaurant", "cafe", "bar", "pub", "fast_food", "ice_cream",
+        "food_court", "biergarten",
+    },
+    "entertainment": {
+        "cinema", "theatre", "nightclub", "arts_centre", "casino",
+        "community_centre", "events_venue",
+    },
+    "transient": {
+        "marketplace", "vending_machine", "bicycle_rental", "car_sharing",
+        "parking_space", "charging_station",
+    },
+}
+CLASS_TTL_SECONDS: Dict[str, int] = {
+    "food_drink": 3 * DAY,
+    "entertainment": 7 * DAY,
+    "transient": 1 * HOUR,
+}
+DEFAULT_TTL_SECONDS = int(os.environ.get("OVERPASS_CACHE_TTL", str(DAY)))
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "durhack_cache", "overpass_cache.sqlite3")
+
+
+# ---------------- canonical keys ----------------
+def canonical_polygon(polygon: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """
+    Quantize a (lat, lon) polygon and put it in a canonical vertex order so that the same
+    area drawn from a different starting vertex or direction maps to the same key.
+    """
+    coords: List[Tuple[float, float]] = []
+    for lat, lon in polygon:
+        q = (round(float(lat), QUANTIZE_DECIMALS), round(float(lon), QUANTIZE_DECIMALS))
+        if not coords or coords[-1] != q:
+            coords.append(q)
+    if len(coords) > 1 and coords[0] == coords[-1]:
+        coords.pop()
+    if len(coords) < 3:
+        return coords
+
+    # Orientation via the shoelace formula (lon as x, lat as y); make it counter-clockwise.
+    area2 = 0.0
+    for i, (lat1, lon1) in enumerate(coords):
+        lat2, lon2 = coords[(i + 1) % len(coords)]
+        area2 += lon1 * lat2 - lon2 * lat1
+    if area2 < 0:
+        coords.reverse()
+
+    start = coords.index(min(coords))
+    return coords[start:] + coords[:start]
+
+
+def canonical_amenities(amenity_filters: List[str]) -> List[str]:
+    """Sorted, de-duplicated list of "key=value" filters."""
+    return sorted({a.strip() for a in amenity_filters if isinstance(a, str) and a.strip()})
+
+
+def amenity_key(amenity_filters: List[str]) -> str:
+    return "|".join(canonical_amenities(amenity_filters))
+
+
+def make_cache_key(polygon: List[Tuple[float, float]], amenity_filters: List[str]) -> str:
+    payload = {
+        "polygon": canonical_polygon(polygon),
+        "amenities": canonical_amenities(amenity_filters),
+    }
+    return hashlib.sha1(json.dumps(payload, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def ttl_for_amenities(amenity_filters: List[str]) -> int:
+    """An entry lives as long as its most volatile amenity class allows."""
+    ttls = []
+    for a in canonical_amenities(amenity_filters):
+        value = a.split("=", 1)[1] if "=" in a else a
+        ttl = DEFAULT_TTL_SECONDS
+        for cls, members in AMENITY_CLASSES.items():
+            if value in members:
+                ttl = CLASS_TTL_SECONDS[cls]
+                break
+        ttls.append(ttl)
+    return min(ttls) if ttls else DEFAULT_TTL_SECONDS
+
+
+# ---------------- SQLite store ----------------
+class OverpassCache:
+    """
+    SQLite-backed result cache with TTL expiry and LRU eviction.
+
+    A new connection is opened per operation so the cache can be used from worker threads
+    (callers in async code should go through asyncio.to_thread).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.environ.get("OVERPASS_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("OVERPASS_CACHE_MAX_ENTRIES", "500"))
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS overpass_cache (
+                    key TEXT PRIMARY KEY,
+                    amenity_key TEXT NOT NULL,
+                    polygon TEXT NOT NULL,
+                    min_lat REAL NOT NULL,
+                    min_lon REAL NOT NULL,
+                    max_lat REAL NOT NULL,
+                    max_lon REAL NOT NULL,
+                    elements TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_overpass_cache_amenity ON overpass_cache (amenity_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_overpass_cache_access ON overpass_cache (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:  # commit on success, roll back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached elements for `key`, or None if missing/expired."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT elements, expires_at FROM overpass_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM overpass_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE overpass_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(
+        self,
+        polygon: List[Tuple[float, float]],
+        amenity_filters: List[str],
+        elements: List[Dict[str, Any]],
+        ttl: Optional[int] = None,
+    ) -> str:
+        """Store `elements` for (polygon, amenity_filters) and return the cache key."""
+        key = make_cache_key(polygon, amenity_filters)
+        poly = canonical_polygon(polygon)
+        lats = [p[0] for p in poly] or [0.0]
+        lons = [p[1] for p in poly] or [0.0]
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else ttl_for_amenities(amenity_filters))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO overpass_cache
+                    (key, amenity_key, polygon, min_lat, min_lon, max_lat, max_lon, elements, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key, amenity_key(amenity_filters), json.dumps(poly),
+                    min(lats), min(lons), max(lats), max(lons),
+                    json.dumps(elements, separators=(",", ":")), expires_at, now,
+                ),
+            )
+            self._evict(conn, now)
+        return key
+
+    def find_containing(
+        self,
+        polygon: List[Tuple[float, float]],
+        amenity_filters: List[str],
+        max_candidates: int = 20,
+    ) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        Find a live entry for the same amenity set whose polygon fully contains `polygon`.
+        Candidates are pre-selected by bounding box in SQL, smallest first, then checked with an
+        exact polygon-in-polygon test. Returns (elements, expires_at) or None.
+        """
+        poly = canonical_polygon(polygon)
+        if len(poly) < 3:
+            return None
+        lats = [p[0] for p in poly]
+        lons = [p[1] for p in poly]
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT key, polygon, elements, expires_at FROM overpass_cache
+                WHERE amenity_key = ? AND expires_at > ?
+                  AND min_lat <= ? AND min_lon <= ? AND max_lat >= ? AND max_lon >= ?
+                ORDER BY (max_lat - min_lat) * (max_lon - min_lon) ASC
+                LIMIT ?
+                """,
+                (amenity_key(amenity_filters), now, min(lats), min(lons), max(lats), max(lons), max_candidates),
+            ).fetchall()
+            for key, cached_polygon, elements, expires_at in rows:
+                if polygon_contains_polygon(json.loads(cached_polygon), poly):
+                    conn.execute("UPDATE overpass_cache SET last_access = ? WHERE key = ?", (now, key))
+                    return json.loads(elements), expires_at
+        return None
+
+    def find_overlapping(
+        self,
+        polygon: List[Tuple[float, float]],
+        amenity_filters: List[str],
+        max_candidates: int = 20,
+    ) -> List[Tuple[str, List[Tuple[float, float]], float]]:
+        """
+        Return live entries for the same amenity set whose bounding box intersects `polygon`'s,
+        most recently used first, as (key, polygon, expires_at) tuples. Elements are not loaded;
+        fetch the chosen entry with `get(key)`.
+        """
+        poly = canonical_polygon(polygon)
+        if len(poly) < 3:
+            return []
+        lats = [p[0] for p in poly]
+        lons = [p[1] for p in poly]
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT key, polygon, expires_at FROM overpass_cache
+                WHERE amenity_key = ? AND expires_at > ?
+                  AND min_lat <= ? AND max_lat >= ? AND min_lon <= ? AND max_lon >= ?
+                ORDER BY last_access DESC
+                LIMIT ?
+                """,
+                (amenity_key(amenity_filters), time.time(), max(lats), min(lats), max(lons), min(lons), max_candidates),
+            ).fetchall()
+        return [
+            (key, [tuple(p) for p in json.loads(cached_polygon)], expires_at)
+            for key, cached_polygon, expires_at in rows
+        ]
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM overpass_cache WHERE expires_at <= ?", (now,))
+        conn.execute(
+            """
+            DELETE FROM overpass_cache WHERE key IN (
+                SELECT key FROM overpass_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM overpass_cache")
+
+
+_CACHE: Optional[OverpassCache] = None
+
+
+def get_overpass_cache() -> OverpassCache:
+    """Return the process-wide OverpassCache (created on first use)."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = OverpassCache()
+    return _CACHE
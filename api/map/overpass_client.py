@@ -0,0 +1,204 @@
+# api/map/overpass_client.py
+"""
+Async Overpass client with mirror failover and hedged requests (connections are pooled by the
+shared outbound HTTP layer, api.common.http_client).
+
+One client is shared by the whole process (see `get_overpass_client`). Every query goes to the
+first healthy mirror; if that mirror has not answered within its observed p95 latency a second,
+"hedged" copy of the request is sent to the next mirror and whichever answers first wins.
+Mirrors answering 429 (rate limited) or 504 (server busy/timeout) are skipped for a short cooldown
+and the query fails over to the next one.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+import httpx
+
+from api.common.http_client import get_http_client
+
+# Public Overpass instances. Override with a comma-separated OVERPASS_URLS env var.
+DEFAULT_OVERPASS_URLS = [
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://overpass.private.coffee/api/interpreter",
+]
+
+# HTTP statuses that mean "this mirror is overloaded right now, try another one".
+FAILOVER_STATUSES = {429, 502, 503, 504}
+
+
+class OverpassUnavailableError(RuntimeError):
+    """Raised when every configured Overpass mirror failed to answer a query."""
+
+
+class _MirrorBusyError(Exception):
+    """Internal: a mirror answered with one of FAILOVER_STATUSES."""
+
+    def __init__(self, url: str, status_code: int):
+        super().__init__(f"{url} answered HTTP {status_code}")
+        self.url = url
+        self.status_code = status_code
+
+
+def _endpoints_from_env() -> List[str]:
+    raw = os.environ.get("OVERPASS_URLS", "")
+    urls = [u.strip() for u in raw.split(",") if u.strip()]
+    return urls or list(DEFAULT_OVERPASS_URLS)
+
+
+class OverpassClient:
+    """
+    Async Overpass client.
+
+    - `endpoints`: ordered list of mirror URLs; the first healthy one is tried first.
+    - `hedge_delay`: delay before hedging used until enough latency samples exist to compute p95.
+    - `hedge_quantile`: latency quantile after which a hedged request is sent (default p95).
+    - `cooldown`: seconds a mirror is skipped after answering 429/504 or failing to connect.
+    """
+
+    def __init__(
+        self,
+        endpoints: Optional[List[str]] = None,
+        hedge_delay: float = 5.0,
+        hedge_quantile: float = 0.95,
+        min_samples: int = 20,
+        cooldown: float = 30.0,
+    ):
+        self.endpoints = list(endpoints) if endpoints else _endpoints_from_env()
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self._cooldown_until: Dict[str, float] = {}
+
+    # ---------- latency bookkeeping ----------
+    def _current_hedge_delay(self) -> float:
+        """Observed `hedge_quantile` latency, or the static default while we lack samples."""
+        if len(self._latencies) < self.min_samples:
+            return self.hedge_delay
+        ordered = sorted(self._latencies)
+        idx = min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))
+        return ordered[idx]
+
+    def _ordered_endpoints(self) -> List[str]:
+        """Healthy mirrors first (in configured order), mirrors in cooldown last."""
+        now = time.monotonic()
+        healthy = [u for u in self.endpoints if self._cooldown_until.get(u, 0.0) <= now]
+        cooling = [u for u in self.endpoints if u not in healthy]
+        return healthy + cooling
+
+    # ---------- single request ----------
+    async def _post(self, url: str, overpass_query: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            resp = await get_http_client().request("overpass", "POST", url, data={"data": overpass_query})
+        except httpx.TransportError:
+            self._cooldown_until[url] = time.monotonic() + self.cooldown
+            raise
+        if resp.status_code in FAILOVER_STATUSES:
+            self._cooldown_until[url] = time.monotonic() + self.cooldown
+            raise _MirrorBusyError(url, resp.status_code)
+        resp.raise_for_status()
+        data = resp.json()
+        self._latencies.append(time.monotonic() - started)
+        return data
+
+    # ---------- public API ----------
+    async def query(self, overpass_query: str) -> Dict[str, Any]:
+        """
+        Run `overpass_query` and return the parsed JSON.
+
+        Raises httpx.HTTPStatusError for non-retryable HTTP errors (e.g. 400 on a malformed query)
+        and OverpassUnavailableError when every mirror was busy or unreachable.
+        """
+        remaining = self._ordered_endpoints()
+        pending: Dict[asyncio.Task, str] = {}
+        errors: List[str] = []
+
+        def launch() -> None:
+            url = remaining.pop(0)
+            pending[asyncio.create_task(self._post(url, overpass_query))] = url
+
+        launch()
+        try:
+            while pending:
+                # While a spare mirror exists and only one request is in flight, wait no longer
+                # than the hedge delay before sending a duplicate to the next mirror.
+                wait_timeout = self._current_hedge_delay() if remaining and len(pending) == 1 else None
+                done, _ = await asyncio.wait(
+                    pending.keys(), timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logging.info("Overpass request slower than %.2fs; hedging to next mirror", wait_timeout)
+                    launch()
+                    continue
+
+                for task in done:
+                    url = pending.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        return task.result()
+                    if isinstance(exc, (_MirrorBusyError, httpx.TransportError)):
+                        logging.warning("Overpass mirror %s failed (%s); failing over", url, exc)
+                        errors.append(f"{url}: {exc}")
+                        if remaining and not pending:
+                            launch()
+                        continue
+                    raise exc
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise OverpassUnavailableError("All Overpass mirrors failed: " + "; ".join(errors))
+
+    async def stream(self, overpass_query: str) -> AsyncIterator[bytes]:
+        """
+        Run `overpass_query` and yield the raw response body in chunks.
+
+        Fails over between mirrors like `query` as long as no bytes have been yielded yet;
+        streamed requests are not hedged (the first mirror to send headers owns the response).
+        """
+        errors: List[str] = []
+        yielded = False
+        for url in self._ordered_endpoints():
+            started = time.monotonic()
+            try:
+                async with get_http_client().stream("overpass", "POST", url, data={"data": overpass_query}) as resp:
+                    if resp.status_code in FAILOVER_STATUSES:
+                        self._cooldown_until[url] = time.monotonic() + self.cooldown
+                        errors.append(f"{url}: HTTP {resp.status_code}")
+                        logging.warning("Overpass mirror %s answered HTTP %s; failing over", url, resp.status_code)
+                        continue
+                    if resp.is_error:
+                        await resp.aread()
+                        resp.raise_for_status()
+                    self._latencies.append(time.monotonic() - started)
+                    async for chunk in resp.aiter_bytes():
+                        yielded = True
+                        yield chunk
+                    return
+            except httpx.TransportError as exc:
+                self._cooldown_until[url] = time.monotonic() + self.cooldown
+                if yielded:
+                    # part of the body already went to the caller; cannot restart elsewhere
+                    raise
+                errors.append(f"{url}: {exc}")
+                logging.warning("Overpass mirror %s failed (%s); failing over", url, exc)
+        raise OverpassUnavailableError("All Overpass mirrors failed: " + "; ".join(errors))
+
+
+_CLIENT: Optional[OverpassClient] = None
+
+
+def get_overpass_client() -> OverpassClient:
+    """Return the process-wide OverpassClient (created on first use)."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = OverpassClient()
+    return _CLIENT
@@ -0,0 +1,488 @@
+# api/map/overpass_search.py
+"""
+Polygon + amenity search on top of Overpass, with a persistent result cache in front of it.
+
+Routes should call `search_elements` instead of building queries and calling `query_overpass`
+themselves. Drawn polygons are first simplified (see SIMPLIFY_TOLERANCE_M) so freehand outlines
+with hundreds of vertices do not slow Overpass down. A search is then answered, in order of
+preference, by:
+  1. an exact cache hit (same quantized polygon and amenity set);
+  2. a cached search whose polygon contains the new one (filtered locally);
+  3. a delta query: when a cached search overlaps most of the new polygon (e.g. the user dragged
+     one vertex), only the newly added region is fetched and merged with the cached elements;
+  4. per-tile cache entries (see api.map.tile_cache), fetching only missing tiles and prefetching
+     the neighbouring tiles in the background, for polygons covering few enough tiles;
+  5. a full Overpass query.
+Results assembled from older parts (delta, tiles) are cached only until the oldest part expires.
+`search_elements_multi` does the same for several polygons, fetching every uncached polygon in
+one Overpass union query. With POI_BACKEND=local every search is answered from the offline
+POI index instead (see api.map.poi_index) and Overpass is never contacted.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from shapely.geometry import Point
+
+from api.common.singleflight import SingleFlight
+from api.map.leaflet_to_overpass import (
+    get_latlon_from_element,
+    normalize_amenity_filters,
+    polygon_to_overpass_poly_string,
+    build_overpass_bbox_query,
+    build_overpass_union_query,
+    query_overpass,
+)
+from api.map.geometry import (
+    element_coordinates,
+    filter_elements_in_polygon,
+    points_in_polygon,
+    polygons_bbox,
+    shape_to_polygons,
+    simplify_polygon,
+    to_shape,
+)
+from api.map.overpass_cache import canonical_amenities, get_overpass_cache, make_cache_key, ttl_for_amenities
+from api.map.overpass_client import get_overpass_client
+from api.map.overpass_stream import iter_elements, project_element
+from api.map.poi_index import get_poi_index, use_local_index
+from api.map.tile_cache import (
+    MAX_TILES_PER_SEARCH,
+    Tile,
+    get_tile_cache,
+    neighbour_tiles,
+    tile_bbox,
+    tile_count_for_polygon,
+    tiles_for_polygon,
+)
+
+# Freehand polygons are simplified before querying: outline error tolerance in metres
+# (0 disables) and algorithm ("dp" = Douglas-Peucker, "vw" = Visvalingam-Whyatt).
+SIMPLIFY_TOLERANCE_M = float(os.environ.get("OVERPASS_SIMPLIFY_TOLERANCE_M", "10"))
+SIMPLIFY_METHOD = os.environ.get("OVERPASS_SIMPLIFY_METHOD", "dp")
+
+SEARCH_FLIGHT = SingleFlight("overpass-search")
+
+# Upper bound on neighbour tiles warmed in the background after a tiled search.
+PREFETCH_MAX_TILES = int(os.environ.get("OVERPASS_PREFETCH_MAX_TILES", "16"))
+
+# Use a delta query only if the region to fetch is at most this fraction of the new polygon;
+# beyond that a full query is about as cheap and simpler.
+DELTA_MAX_ADDED_FRACTION = 0.5
+# Added-region slivers smaller than this fraction of the new polygon are ignored (quantization noise).
+DELTA_MIN_PIECE_FRACTION = 1e-4
+
+
+def prepare_polygon(polygon: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Simplify a drawn polygon before it is used as a cache key or Overpass poly filter."""
+    return simplify_polygon(polygon, SIMPLIFY_TOLERANCE_M, SIMPLIFY_METHOD)
+
+
+async def fetch_elements(polygons: List[List[Tuple[float, float]]], amenity_filters: List[str]) -> List[Dict[str, Any]]:
+    """Query Overpass directly (no cache) for the union of `polygons` and return the `elements` list."""
+    polygons = [p for p in polygons if p]
+    poly_strings = [polygon_to_overpass_poly_string(p) for p in polygons]
+    if not poly_strings:
+        raise ValueError("Invalid polygon coordinates.")
+    query = build_overpass_union_query(poly_strings, amenity_filters, bbox=polygons_bbox(polygons))
+    raw = await query_overpass(query)
+    return raw.get("elements", []) if isinstance(raw, dict) else []
+
+
+def _merge_elements(*element_lists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Concatenate element lists, keeping the first occurrence of each (type, id)."""
+    seen = set()
+    merged = []
+    for elements in element_lists:
+        for el in elements:
+            ref = (el.get("type"), el.get("id"))
+            if ref in seen:
+                continue
+            seen.add(ref)
+            merged.append(el)
+    return merged
+
+
+def _plan_delta(
+    polygon: List[Tuple[float, float]],
+    candidates: List[Tuple[str, List[Tuple[float, float]], float]],
+) -> Optional[Tuple[str, float, List[List[Tuple[float, float]]]]]:
+    """
+    Pick the cached polygon that leaves the smallest region still to fetch.
+    Returns (cache_key, expires_at, added_region_polygons) or None if no candidate is worth it.
+    """
+    try:
+        new_shape = to_shape(polygon)
+    except Exception:
+        logging.exception("Could not build polygon geometry for delta query")
+        return None
+    if new_shape.is_empty or new_shape.area <= 0:
+        return None
+
+    best = None
+    for key, cached_polygon, expires_at in candidates:
+        try:
+            added = new_shape.difference(to_shape(cached_polygon))
+        except Exception:
+            continue
+        if added.area > DELTA_MAX_ADDED_FRACTION * new_shape.area:
+            continue
+        if best is None or added.area < best[0].area:
+            best = (added, key, expires_at)
+    if best is None:
+        return None
+
+    added, key, expires_at = best
+    pieces = shape_to_polygons(added, min_area=DELTA_MIN_PIECE_FRACTION * new_shape.area)
+    return key, expires_at, pieces
+
+
+async def _lookup_cached(polygon: List[Tuple[float, float]], amenity_filters: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """Answer from the cache without touching the network (exact hit or containing polygon)."""
+    cache = get_overpass_cache()
+    key = make_cache_key(polygon, amenity_filters)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached
+
+    # A previously searched polygon that fully contains this one already holds every element
+    # we need: filter it locally instead of going back to Overpass.
+    containing = await asyncio.to_thread(cache.find_containing, polygon, amenity_filters)
+    if containing is not None:
+        parent_elements, parent_expires_at = containing
+        elements = await asyncio.to_thread(filter_elements_in_polygon, parent_elements, polygon)
+        ttl = max(0, int(parent_expires_at - time.time()))
+        await asyncio.to_thread(cache.put, polygon, amenity_filters, elements, ttl)
+        return elements
+    return None
+
+
+def _matches_filter(el: Dict[str, Any], amenity_filter: str) -> bool:
+    k, v = amenity_filter.split("=", 1)
+    return str((el.get("tags") or {}).get(k.strip())) == v.strip()
+
+
+def _element_bounds(el: Dict[str, Any]) -> Optional[Tuple[float, float, float, float]]:
+    """(south, west, north, east) of an element: its `bounds`, or its point/center as a box."""
+    bounds = el.get("bounds")
+    if isinstance(bounds, dict) and all(bounds.get(k) is not None for k in ("minlat", "minlon", "maxlat", "maxlon")):
+        return float(bounds["minlat"]), float(bounds["minlon"]), float(bounds["maxlat"]), float(bounds["maxlon"])
+    latlon = get_latlon_from_element(el)
+    if latlon is None:
+        return None
+    return latlon["lat"], latlon["lon"], latlon["lat"], latlon["lon"]
+
+
+async def _fetch_tiles(
+    keys: List[Tuple[Tile, str]],
+) -> Dict[Tuple[Tile, str], Tuple[List[Dict[str, Any]], float]]:
+    """
+    Fetch (tile, amenity filter) pairs in one Overpass query and store them in the tile cache.
+    Elements are filed under every requested tile their bounds overlap (nodes: the tile holding
+    them), so a way reaching into a tile is found there even when its center lies elsewhere.
+    Returns the entries as (elements, expires_at).
+    """
+    filters_by_tile: Dict[Tile, List[str]] = {}
+    for tile, amenity_filter in keys:
+        filters_by_tile.setdefault(tile, []).append(amenity_filter)
+    bboxes = {t: tile_bbox(t) for t in filters_by_tile}
+    query = build_overpass_bbox_query([(bboxes[t], fs) for t, fs in filters_by_tile.items()])
+    raw = await query_overpass(query)
+
+    entries: Dict[Tuple[Tile, str], List[Dict[str, Any]]] = {k: [] for k in keys}
+    for el in raw.get("elements", []) if isinstance(raw, dict) else []:
+        bounds = _element_bounds(el)
+        if bounds is None:
+            continue
+        south, west, north, east = bounds
+        for tile, (t_south, t_west, t_north, t_east) in bboxes.items():
+            if south > t_north or north < t_south or west > t_east or east < t_west:
+                continue
+            for amenity_filter in filters_by_tile[tile]:
+                if _matches_filter(el, amenity_filter):
+                    entries[(tile, amenity_filter)].append(el)
+
+    ttls = {f: ttl_for_amenities([f]) for _, f in keys}
+    await asyncio.to_thread(get_tile_cache().put_many, entries, ttls)
+    now = time.time()
+    return {(tile, f): (els, now + ttls[f]) for (tile, f), els in entries.items()}
+
+
+_PREFETCH_TASKS: Set[asyncio.Task] = set()
+_PREFETCH_INFLIGHT: Set[Tuple[Tile, str]] = set()
+
+
+def _schedule_prefetch(tiles: Set[Tile], amenity_filters: List[str]) -> None:
+    """Warm the ring of tiles around a search in the background (nearby rooms/edits hit the cache)."""
+    ring = sorted(neighbour_tiles(tiles))[:PREFETCH_MAX_TILES]
+    keys = [(t, f) for t in ring for f in amenity_filters if (t, f) not in _PREFETCH_INFLIGHT]
+    if not keys:
+        return
+
+    async def prefetch() -> None:
+        try:
+            missing = await asyncio.to_thread(get_tile_cache().missing, keys)
+            if missing:
+                await _fetch_tiles(missing)
+        except Exception:
+            logging.exception("Background tile prefetch failed")
+        finally:
+            _PREFETCH_INFLIGHT.difference_update(keys)
+
+    _PREFETCH_INFLIGHT.update(keys)
+    task = asyncio.create_task(prefetch())
+    _PREFETCH_TASKS.add(task)
+    task.add_done_callback(_PREFETCH_TASKS.discard)
+
+
+async def _tile_search(
+    polygons: List[List[Tuple[float, float]]],
+    amenity_filters: List[str],
+) -> Optional[List[Tuple[List[Dict[str, Any]], float]]]:
+    """
+    Answer each polygon from per-(tile, amenity) cache entries, fetching only the missing tiles
+    (one Overpass query) and clipping the assembled elements to each polygon. Returns one
+    (elements, expires_at of its oldest tile) pair per polygon, or None when the polygons cover
+    too many tiles for this to pay off.
+    """
+    if MAX_TILES_PER_SEARCH <= 0:
+        return None
+    if sum(tile_count_for_polygon(p) for p in polygons) > MAX_TILES_PER_SEARCH:
+        return None
+
+    tiles_per_polygon = [await asyncio.to_thread(tiles_for_polygon, p) for p in polygons]
+    all_tiles = set().union(*tiles_per_polygon)
+    keys = [(t, f) for t in sorted(all_tiles) for f in amenity_filters]
+    found = await asyncio.to_thread(get_tile_cache().get_many, keys)
+    missing = [k for k in keys if k not in found]
+    if missing:
+        found.update(await _fetch_tiles(missing))
+    _schedule_prefetch(all_tiles, amenity_filters)
+
+    per_polygon = []
+    for polygon, tiles in zip(polygons, tiles_per_polygon):
+        parts = [found[(t, f)] for t in tiles for f in amenity_filters]
+        assembled = _merge_elements(*(els for els, _ in parts))
+        # clipped by point/center like every other cache path, so results do not depend on the path
+        elements = await asyncio.to_thread(filter_elements_in_polygon, assembled, polygon)
+        per_polygon.append((elements, min(expires_at for _, expires_at in parts)))
+    return per_polygon
+
+
+async def search_elements(
+    polygon: List[Tuple[float, float]],
+    amenity: Union[str, List[str]],
+) -> List[Dict[str, Any]]:
+    """
+    Return Overpass elements inside `polygon` matching `amenity` (a value, "key=value" filter
+    or list of either), reusing cached searches wherever possible (see module docstring).
+    """
+    amenity_filters = canonical_amenities(normalize_amenity_filters(amenity))
+    if not amenity_filters:
+        raise ValueError("At least one amenity filter is required.")
+
+    polygon = prepare_polygon(polygon)
+    if use_local_index():
+        return await asyncio.to_thread(get_poi_index().query, polygon, amenity_filters)
+
+    # concurrent identical searches (e.g. a whole room opening the map at once) share one run
+    key = make_cache_key(polygon, amenity_filters)
+    return await SEARCH_FLIGHT.do(key, lambda: _search_uncoalesced(polygon, amenity_filters))
+
+
+async def _search_uncoalesced(polygon: List[Tuple[float, float]], amenity_filters: List[str]) -> List[Dict[str, Any]]:
+    cache = get_overpass_cache()
+    cached = await _lookup_cached(polygon, amenity_filters)
+    if cached is not None:
+        return cached
+
+    # An edited polygon mostly overlapping a cached one: fetch only the added region, drop what
+    # fell in the removed region (by clipping to the new polygon) and merge.
+    candidates = await asyncio.to_thread(cache.find_overlapping, polygon, amenity_filters)
+    plan = await asyncio.to_thread(_plan_delta, polygon, candidates) if candidates else None
+    if plan is not None:
+        prev_key, prev_expires_at, added_pieces = plan
+        prev_elements = await asyncio.to_thread(cache.get, prev_key)
+        if prev_elements is not None:
+            added_elements = await fetch_elements(added_pieces, amenity_filters) if added_pieces else []
+            merged = _merge_elements(prev_elements, added_elements)
+            elements = await asyncio.to_thread(filter_elements_in_polygon, merged, polygon)
+            # the merged result is only as fresh as its oldest part
+            ttl = max(0, int(min(prev_expires_at - time.time(), ttl_for_amenities(amenity_filters))))
+            await asyncio.to_thread(cache.put, polygon, amenity_filters, elements, ttl)
+            return elements
+
+    # Small/medium polygons are assembled from per-tile cache entries shared across rooms.
+    tiled = await _tile_search([polygon], amenity_filters)
+    if tiled is not None:
+        elements, expires_at = tiled[0]
+        await asyncio.to_thread(cache.put, polygon, amenity_filters, elements, max(0, int(expires_at - time.time())))
+        return elements
+
+    elements = await fetch_elements([polygon], amenity_filters)
+    await asyncio.to_thread(cache.put, polygon, amenity_filters, elements)
+    return elements
+
+
+async def search_elements_multi(
+    polygons: List[List[Tuple[float, float]]],
+    amenity: Union[str, List[str]],
+) -> List[Dict[str, Any]]:
+    """
+    Search several polygons at once. Polygons the cache cannot answer are fetched together in a
+    single Overpass union; the result is de-duplicated by (type, id) and every element gets a
+    `polygon_indices` list naming the polygon(s) (indexes into `polygons`) it belongs to.
+    Rings with fewer than three vertices are skipped, but indexes still refer to `polygons` as
+    passed in.
+    """
+    valid = [i for i, p in enumerate(polygons) if len(p) >= 3]
+    if not valid:
+        raise ValueError("Invalid polygon coordinates.")
+    if len(valid) == 1:
+        return [{**el, "polygon_indices": valid} for el in await search_elements(polygons[valid[0]], amenity)]
+
+    amenity_filters = canonical_amenities(normalize_amenity_filters(amenity))
+    if not amenity_filters:
+        raise ValueError("At least one amenity filter is required.")
+
+    prepared = [prepare_polygon(polygons[i]) for i in valid]
+    if use_local_index():
+        index = get_poi_index()
+        merged = _merge_with_membership(
+            [await asyncio.to_thread(index.query, p, amenity_filters) for p in prepared]
+        )
+    else:
+        key = tuple(make_cache_key(p, amenity_filters) for p in prepared)
+        merged = await SEARCH_FLIGHT.do(key, lambda: _search_multi_uncoalesced(prepared, amenity_filters))
+    return [{**el, "polygon_indices": [valid[i] for i in el["polygon_indices"]]} for el in merged]
+
+
+async def _search_multi_uncoalesced(
+    polygons: List[List[Tuple[float, float]]],
+    amenity_filters: List[str],
+) -> List[Dict[str, Any]]:
+    per_polygon: List[Optional[List[Dict[str, Any]]]] = list(
+        await asyncio.gather(*(_lookup_cached(p, amenity_filters) for p in polygons))
+    )
+    missing = [i for i, els in enumerate(per_polygon) if els is None]
+
+    if len(missing) == 1:
+        # a single uncached polygon can still use the delta path (already prepared and coalesced)
+        per_polygon[missing[0]] = await _search_uncoalesced(polygons[missing[0]], amenity_filters)
+    elif missing:
+        missing_polygons = [polygons[i] for i in missing]
+        tiled = await _tile_search(missing_polygons, amenity_filters)
+        if tiled is not None:
+            split = [els for els, _ in tiled]
+            ttls: List[Optional[int]] = [max(0, int(expires_at - time.time())) for _, expires_at in tiled]
+        else:
+            fetched = await fetch_elements(missing_polygons, amenity_filters)
+            split = await asyncio.to_thread(_split_by_polygon, fetched, missing_polygons)
+            ttls = [None] * len(split)
+        cache = get_overpass_cache()
+        for i, els, ttl in zip(missing, split, ttls):
+            per_polygon[i] = els
+            await asyncio.to_thread(cache.put, polygons[i], amenity_filters, els, ttl)
+
+    return _merge_with_membership(per_polygon)
+
+
+def _merge_with_membership(per_polygon: List[Optional[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """De-duplicate per-polygon results by (type, id) and tag each element with polygon_indices."""
+    membership: Dict[Tuple[Any, Any], List[int]] = {}
+    merged: List[Dict[str, Any]] = []
+    for idx, elements in enumerate(per_polygon):
+        for el in elements or []:
+            ref = (el.get("type"), el.get("id"))
+            if ref not in membership:
+                membership[ref] = []
+                merged.append(el)
+            membership[ref].append(idx)
+    return [{**el, "polygon_indices": membership[(el.get("type"), el.get("id"))]} for el in merged]
+
+
+def _split_by_polygon(
+    elements: List[Dict[str, Any]],
+    polygons: List[List[Tuple[float, float]]],
+) -> List[List[Dict[str, Any]]]:
+    """
+    Distribute the elements of a union query over the polygons that contain their point/center.
+    Ways and relations can match a polygon while their center lies outside every polygon; those
+    go to the nearest polygon, and elements without any coordinates go to every polygon, so
+    nothing Overpass returned is lost.
+    """
+    lats, lons, has_coords = element_coordinates(elements)
+    inside = np.zeros((len(polygons), len(elements)), dtype=bool)
+    inside[:, ~has_coords] = True
+    for i, polygon in enumerate(polygons):
+        inside[i, has_coords] = points_in_polygon(lats[has_coords], lons[has_coords], polygon)
+
+    shapes = None
+    for j in np.flatnonzero(has_coords & ~inside.any(axis=0)):
+        if shapes is None:
+            shapes = [to_shape(p) for p in polygons]
+        point = Point(lons[j], lats[j])
+        inside[int(np.argmin([shape.distance(point) for shape in shapes])), j] = True
+
+    return [[el for el, keep in zip(elements, row) if keep] for row in inside]
+
+
+async def stream_elements(
+    polygons: List[List[Tuple[float, float]]],
+    amenity: Union[str, List[str]],
+    max_elements: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Like `search_elements_multi`, but yields elements one at a time with bounded memory.
+
+    If the cache can answer every polygon the cached elements are replayed; otherwise the Overpass
+    response is parsed incrementally and never held in full (and so is not cached). At most
+    `max_elements` elements are produced (also passed to Overpass as an output limit) and each
+    is reduced to `fields` (see overpass_stream.project_element) before it is yielded.
+    """
+    valid = [i for i, p in enumerate(polygons) if len(p) >= 3]
+    if not valid:
+        raise ValueError("Invalid polygon coordinates.")
+    polygons = [prepare_polygon(polygons[i]) for i in valid]
+    amenity_filters = canonical_amenities(normalize_amenity_filters(amenity))
+    if not amenity_filters:
+        raise ValueError("At least one amenity filter is required.")
+
+    keep_fields = fields + ["polygon_indices"] if fields else None
+
+    if use_local_index():
+        index = get_poi_index()
+        per_polygon = [await asyncio.to_thread(index.query, p, amenity_filters) for p in polygons]
+    else:
+        per_polygon = list(await asyncio.gather(*(_lookup_cached(p, amenity_filters) for p in polygons)))
+    if all(els is not None for els in per_polygon):
+        for count, el in enumerate(_merge_with_membership(per_polygon)):
+            if max_elements is not None and count >= max_elements:
+                return
+            el["polygon_indices"] = [valid[i] for i in el["polygon_indices"]]
+            yield project_element(el, keep_fields)
+        return
+
+    query = build_overpass_union_query(
+        [polygon_to_overpass_poly_string(p) for p in polygons],
+        amenity_filters,
+        bbox=polygons_bbox(polygons),
+        limit=max_elements,
+    )
+    count = 0
+    async for el in iter_elements(get_overpass_client().stream(query)):
+        latlon = get_latlon_from_element(el)
+        if latlon is not None:
+            lats, lons = np.array([latlon["lat"]]), np.array([latlon["lon"]])
+            el["polygon_indices"] = [valid[i] for i, p in enumerate(polygons) if points_in_polygon(lats, lons, p)[0]]
+        else:
+            el["polygon_indices"] = []
+        yield project_element(el, keep_fields)
+        count += 1
+        if max_elements is not None and count >= max_elements:
+            return
@@ -0,0 +1,92 @@
+# api/map/overpass_stream.py
+"""
+Incremental parsing of Overpass JSON responses.
+
+Overpass answers with one JSON object whose "elements" array can be many megabytes. Instead of
+`resp.json()` on the whole body, `iter_elements` consumes the body chunk by chunk and yields each
+element as soon as it is complete, so memory stays bounded by the largest single element.
+"""
+
+import codecs
+import json
+import logging
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_ELEMENTS_KEY = re.compile(r'"elements"\s*:\s*\[')
+_REMARK = re.compile(r'"remark"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class OverpassStreamError(ValueError):
+    """Raised when the streamed body is not a well-formed Overpass JSON response."""
+
+
+async def iter_elements(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield Overpass elements one by one from an async iterator of raw body chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    in_array = False
+    done = False
+    tail = ""
+
+    async for chunk in chunks:
+        if done:
+            # keep only what we need to spot a trailing "remark" (timeouts, runtime errors)
+            tail = (tail + decoder.decode(chunk))[-4096:]
+            continue
+        buf += decoder.decode(chunk)
+
+        if not in_array:
+            m = _ELEMENTS_KEY.search(buf)
+            if m is None:
+                # header (version, generator, osm3s) is small; keep the end in case the key is split
+                buf = buf[-64:]
+                continue
+            buf = buf[m.end():]
+            in_array = True
+
+        pos = 0
+        while True:
+            while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ","):
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                done = True
+                tail = buf[pos + 1:]
+                break
+            try:
+                element, end = _DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # element not complete yet; wait for more data
+                break
+            pos = end
+            yield element
+        buf = "" if done else buf[pos:]
+
+    if not done:
+        raise OverpassStreamError("Overpass response ended before the elements array was closed")
+    m = _REMARK.search(tail + decoder.decode(b"", final=True))
+    if m:
+        logging.warning("Overpass remark: %s", m.group(1))
+
+
+def project_element(element: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    Keep only `fields` of an element. Dotted names select single tags, e.g.
+    ["type", "id", "lat", "lon", "center", "tags.name"]. None/empty keeps everything.
+    """
+    if not fields:
+        return element
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        if field.startswith("tags."):
+            tag = field[len("tags."):]
+            tags = element.get("tags") or {}
+            if tag in tags:
+                projected.setdefault("tags", {})[tag] = tags[tag]
+        elif field in element:
+            projected[field] = element[field]
+    return projected
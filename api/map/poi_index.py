@@ -0,0 +1,295 @@
+# api/map/poi_index.py
+"""
+Offline POI index: answer polygon + amenity searches from a local SQLite R-tree instead of Overpass.
+
+Build the index from an OSM extract or an Overpass JSON dump, e.g.
+
+    python -m api.map.poi_index build durham.osm.pbf --db /data/poi_index.sqlite3
+    python -m api.map.poi_index build overpass_dump.json --db /data/poi_index.sqlite3
+    python -m api.map.poi_index query --db /data/poi_index.sqlite3 --amenity cafe \\
+        --polygon "54.78,-1.58 54.78,-1.56 54.76,-1.56 54.76,-1.58"
+
+then run the API with POI_BACKEND=local and POI_INDEX_PATH pointing at the file. Searches return
+elements in the same shape as Overpass `out center` (nodes: lat/lon, ways/relations: center).
+
+Only elements tagged with one of INDEXED_KEYS are ingested. Reading .osm.pbf files needs the
+optional `osmium` package (pip install osmium).
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from api.map.geometry import points_in_polygon
+
+try:
+    import osmium
+except Exception:
+    osmium = None
+
+# Tag keys that make an element a POI worth indexing (and that searches can filter on).
+INDEXED_KEYS = ("amenity", "shop", "leisure", "tourism")
+
+DEFAULT_INDEX_PATH = os.environ.get("POI_INDEX_PATH", "poi_index.sqlite3")
+
+
+class POIIndexMissingError(RuntimeError):
+    """Raised when searching an index file that has not been built yet."""
+
+
+class POIIndex:
+    """SQLite R-tree of POIs with a (key, value) tag table for amenity filtering."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_INDEX_PATH
+        self._built = False
+
+    def ensure_built(self) -> None:
+        """Raise POIIndexMissingError unless the index tables exist (checked until they do)."""
+        if self._built:
+            return
+        with self._connect() as conn:
+            found = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'poi_rtree'").fetchone()
+        if found is None:
+            raise POIIndexMissingError(
+                f"POI index {self.path} has not been built; run "
+                f"`python -m api.map.poi_index build <extract.osm.pbf|dump.json> --db {self.path}`"
+            )
+        self._built = True
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self) -> None:
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS poi (
+                    id INTEGER PRIMARY KEY,
+                    osm_type TEXT NOT NULL,
+                    osm_id INTEGER NOT NULL,
+                    element TEXT NOT NULL,
+                    UNIQUE (osm_type, osm_id)
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS poi_rtree USING rtree (
+                    id, min_lat, max_lat, min_lon, max_lon
+                );
+                CREATE TABLE IF NOT EXISTS poi_tag (
+                    poi_id INTEGER NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_poi_tag ON poi_tag (key, value, poi_id);
+                """
+            )
+
+    # ---------------- ingest ----------------
+    def ingest(self, elements: Iterable[Dict[str, Any]], batch_size: int = 5000) -> int:
+        """Insert/replace Overpass-shaped elements. Returns the number of POIs written."""
+        self.create()
+        written = 0
+        batch: List[Tuple[str, int, float, float, Dict[str, Any]]] = []
+        for el in elements:
+            row = _poi_row(el)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += self._write(batch)
+                batch = []
+        if batch:
+            written += self._write(batch)
+        return written
+
+    def _write(self, batch: List[Tuple[str, int, float, float, Dict[str, Any]]]) -> int:
+        with self._connect() as conn:
+            for osm_type, osm_id, lat, lon, el in batch:
+                old = conn.execute(
+                    "SELECT id FROM poi WHERE osm_type = ? AND osm_id = ?", (osm_type, osm_id)
+                ).fetchone()
+                if old is not None:
+                    conn.execute("DELETE FROM poi WHERE id = ?", (old[0],))
+                    conn.execute("DELETE FROM poi_rtree WHERE id = ?", (old[0],))
+                    conn.execute("DELETE FROM poi_tag WHERE poi_id = ?", (old[0],))
+                cur = conn.execute(
+                    "INSERT INTO poi (osm_type, osm_id, element) VALUES (?, ?, ?)",
+                    (osm_type, osm_id, json.dumps(el, separators=(",", ":"))),
+                )
+                poi_id = cur.lastrowid
+                conn.execute("INSERT INTO poi_rtree VALUES (?, ?, ?, ?, ?)", (poi_id, lat, lat, lon, lon))
+                tags = el.get("tags") or {}
+                conn.executemany(
+                    "INSERT INTO poi_tag (poi_id, key, value) VALUES (?, ?, ?)",
+                    [(poi_id, k, str(tags[k])) for k in INDEXED_KEYS if k in tags],
+                )
+        return len(batch)
+
+    # ---------------- search ----------------
+    def query(self, polygon: List[Tuple[float, float]], amenity_filters: List[str]) -> List[Dict[str, Any]]:
+        """
+        Elements inside `polygon` matching any of the normalized "key=value" `amenity_filters`:
+        R-tree bounding-box lookup joined with the tag table, then an exact point-in-polygon test.
+        """
+        self.ensure_built()
+        pairs = [tuple(a.split("=", 1)) for a in amenity_filters if "=" in a]
+        if not polygon or not pairs:
+            return []
+        lats = [p[0] for p in polygon]
+        lons = [p[1] for p in polygon]
+        tag_clause = " OR ".join("(t.key = ? AND t.value = ?)" for _ in pairs)
+        params: List[Any] = [min(lats), max(lats), min(lons), max(lons)]
+        for k, v in pairs:
+            params.extend([k.strip(), v.strip()])
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT DISTINCT p.id, r.min_lat, r.min_lon, p.element
+                FROM poi_rtree r
+                JOIN poi p ON p.id = r.id
+                JOIN poi_tag t ON t.poi_id = p.id
+                WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?
+                  AND ({tag_clause})
+                ORDER BY p.id
+                """,
+                params,
+            ).fetchall()
+        if not rows:
+            return []
+        inside = points_in_polygon(np.array([r[1] for r in rows]), np.array([r[2] for r in rows]), polygon)
+        return [json.loads(r[3]) for r, keep in zip(rows, inside) if keep]
+
+    def count(self) -> int:
+        self.ensure_built()
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM poi").fetchone()[0]
+
+
+def _poi_row(el: Dict[str, Any]) -> Optional[Tuple[str, int, float, float, Dict[str, Any]]]:
+    """(osm_type, osm_id, lat, lon, element) for an indexable Overpass-shaped element, else None."""
+    tags = el.get("tags") or {}
+    if not any(k in tags for k in INDEXED_KEYS):
+        return None
+    if el.get("lat") is not None and el.get("lon") is not None:
+        lat, lon = float(el["lat"]), float(el["lon"])
+    elif isinstance(el.get("center"), dict):
+        lat, lon = float(el["center"]["lat"]), float(el["center"]["lon"])
+    else:
+        return None
+    shaped = {"type": el.get("type"), "id": el.get("id")}
+    if el.get("type") == "node":
+        shaped.update(lat=lat, lon=lon)
+    else:
+        shaped["center"] = {"lat": lat, "lon": lon}
+    shaped["tags"] = tags
+    return str(el.get("type")), int(el.get("id")), lat, lon, shaped
+
+
+# ---------------- readers ----------------
+def read_overpass_json(path: str) -> Iterator[Dict[str, Any]]:
+    """Elements of an Overpass JSON dump (must have been produced with `out center` or `out body`)."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    yield from data.get("elements", [])
+
+
+def read_osm_pbf(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    POI nodes and ways of an .osm.pbf/.osm file as Overpass-shaped elements. Way centers are the
+    mean of their node locations; relations are skipped (no cheap center without member geometry).
+    """
+    if osmium is None:
+        raise RuntimeError("Reading OSM extracts requires the 'osmium' package (pip install osmium).")
+
+    for obj in osmium.FileProcessor(path).with_locations():
+        tags = {t.k: t.v for t in obj.tags}
+        if not any(k in tags for k in INDEXED_KEYS):
+            continue
+        if obj.is_node():
+            if not obj.location.valid():
+                continue
+            yield {"type": "node", "id": obj.id, "lat": obj.location.lat, "lon": obj.location.lon, "tags": tags}
+        elif obj.is_way():
+            locs = [(n.lat, n.lon) for n in obj.nodes if n.location.valid()]
+            if not locs:
+                continue
+            yield {
+                "type": "way",
+                "id": obj.id,
+                "center": {"lat": sum(p[0] for p in locs) / len(locs), "lon": sum(p[1] for p in locs) / len(locs)},
+                "tags": tags,
+            }
+
+
+_INDEX: Optional[POIIndex] = None
+
+
+def get_poi_index() -> POIIndex:
+    """Return the process-wide POIIndex for POI_INDEX_PATH."""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = POIIndex()
+    return _INDEX
+
+
+def use_local_index() -> bool:
+    """True when searches should be answered by the local index (POI_BACKEND=local)."""
+    return os.environ.get("POI_BACKEND", "overpass").strip().lower() == "local"
+
+
+# ---------------- CLI ----------------
+def _parse_polygon(text: str) -> List[Tuple[float, float]]:
+    points = []
+    for pair in text.split():
+        lat, lon = pair.split(",")
+        points.append((float(lat), float(lon)))
+    return points
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query the offline POI index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="ingest an .osm.pbf/.osm extract or an Overpass JSON dump")
+    build.add_argument("input")
+    build.add_argument("--db", default=DEFAULT_INDEX_PATH)
+
+    query = sub.add_parser("query", help="run a polygon + amenity search against the index")
+    query.add_argument("--db", default=DEFAULT_INDEX_PATH)
+    query.add_argument("--amenity", action="append", required=True, help="amenity value or key=value (repeatable)")
+    query.add_argument("--polygon", required=True, help='space-separated "lat,lon" vertices')
+
+    args = parser.parse_args(argv)
+    index = POIIndex(args.db)
+
+    if args.command == "build":
+        reader = read_overpass_json if args.input.endswith(".json") else read_osm_pbf
+        started = time.monotonic()
+        written = index.ingest(reader(args.input))
+        print(f"Indexed {written} POIs into {args.db} in {time.monotonic() - started:.1f}s")
+        return 0
+
+    filters = [a if "=" in a else f"amenity={a}" for a in args.amenity]
+    started = time.monotonic()
+    elements = index.query(_parse_polygon(args.polygon), filters)
+    elapsed_ms = (time.monotonic() - started) * 1000
+    for el in elements:
+        print(json.dumps(el))
+    print(f"{len(elements)} elements in {elapsed_ms:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
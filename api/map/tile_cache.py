@@ -0,0 +1,193 @@
+# api/map/tile_cache.py
+"""
+Tile-based Overpass cache.
+
+Polygons drawn by different rooms in the same city overlap but never match exactly, so whole-query
+caching rarely hits between rooms. Here results are stored per (slippy-map tile, amenity filter):
+a search only fetches the tiles it is missing, assembles the answer from cached tiles and clips it
+to the polygon. A way or relation is stored under every tile its bounding box overlaps. Tiles are
+z/x/y in the standard Web Mercator scheme (OVERPASS_TILE_ZOOM, default 15, about 1 km wide at UK
+latitudes).
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from shapely.geometry import box
+
+from api.map.geometry import to_shape
+from api.map.overpass_cache import DEFAULT_CACHE_PATH
+
+Tile = Tuple[int, int, int]  # (z, x, y)
+
+TILE_ZOOM = int(os.environ.get("OVERPASS_TILE_ZOOM", "15"))
+# Searches covering more tiles than this skip the tile cache (0 disables tiles entirely).
+MAX_TILES_PER_SEARCH = int(os.environ.get("OVERPASS_TILE_MAX", "64"))
+
+
+# ---------------- tile math ----------------
+def tile_for(lat: float, lon: float, zoom: int = TILE_ZOOM) -> Tile:
+    n = 2 ** zoom
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return zoom, min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bbox(tile: Tile) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile."""
+    z, x, y = tile
+    n = 2 ** z
+
+    def lat_at(ty: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lat_at(y + 1), x / n * 360.0 - 180.0, lat_at(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tiles_for_polygon(polygon: List[Tuple[float, float]], zoom: int = TILE_ZOOM) -> List[Tile]:
+    """Tiles whose area intersects the polygon."""
+    shape = to_shape(polygon)
+    lats = [p[0] for p in polygon]
+    lons = [p[1] for p in polygon]
+    _, x0, y0 = tile_for(max(lats), min(lons), zoom)
+    _, x1, y1 = tile_for(min(lats), max(lons), zoom)
+    tiles = []
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            s, w, n, e = tile_bbox((zoom, x, y))
+            if shape.intersects(box(w, s, e, n)):
+                tiles.append((zoom, x, y))
+    return tiles
+
+
+def tile_count_for_polygon(polygon: List[Tuple[float, float]], zoom: int = TILE_ZOOM) -> int:
+    """Upper bound on tiles_for_polygon (tiles in the bounding box), cheap to compute."""
+    lats = [p[0] for p in polygon]
+    lons = [p[1] for p in polygon]
+    _, x0, y0 = tile_for(max(lats), min(lons), zoom)
+    _, x1, y1 = tile_for(min(lats), max(lons), zoom)
+    return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
+def neighbour_tiles(tiles: Iterable[Tile]) -> Set[Tile]:
+    """The ring of tiles around a set of tiles (excluding the set itself)."""
+    tiles = set(tiles)
+    ring = set()
+    for z, x, y in tiles:
+        n = 2 ** z
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                t = (z, (x + dx) % n, y + dy)
+                if 0 <= t[2] < n and t not in tiles:
+                    ring.add(t)
+    return ring
+
+
+# ---------------- SQLite store ----------------
+class TileCache:
+    """Per-(tile, amenity filter) element cache stored next to the polygon cache."""
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.environ.get("OVERPASS_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.environ.get("OVERPASS_TILE_MAX_ENTRIES", "20000"))
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS overpass_tiles (
+                    z INTEGER NOT NULL,
+                    x INTEGER NOT NULL,
+                    y INTEGER NOT NULL,
+                    amenity TEXT NOT NULL,
+                    elements TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (z, x, y, amenity)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_overpass_tiles_access ON overpass_tiles (last_access)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: List[Tuple[Tile, str]]) -> Dict[Tuple[Tile, str], Tuple[List[Dict[str, Any]], float]]:
+        """Return the live entries among `keys` ((tile, amenity filter) pairs) as (elements, expires_at)."""
+        now = time.time()
+        found: Dict[Tuple[Tile, str], Tuple[List[Dict[str, Any]], float]] = {}
+        with self._lock, self._connect() as conn:
+            for (z, x, y), amenity in keys:
+                row = conn.execute(
+                    "SELECT elements, expires_at FROM overpass_tiles WHERE z = ? AND x = ? AND y = ? AND amenity = ? AND expires_at > ?",
+                    (z, x, y, amenity, now),
+                ).fetchone()
+                if row is not None:
+                    found[((z, x, y), amenity)] = (json.loads(row[0]), row[1])
+            conn.executemany(
+                "UPDATE overpass_tiles SET last_access = ? WHERE z = ? AND x = ? AND y = ? AND amenity = ?",
+                [(now, z, x, y, amenity) for (z, x, y), amenity in found],
+            )
+        return found
+
+    def missing(self, keys: List[Tuple[Tile, str]]) -> List[Tuple[Tile, str]]:
+        """The subset of `keys` without a live entry (does not load elements)."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            return [
+                ((z, x, y), amenity)
+                for (z, x, y), amenity in keys
+                if conn.execute(
+                    "SELECT 1 FROM overpass_tiles WHERE z = ? AND x = ? AND y = ? AND amenity = ? AND expires_at > ?",
+                    (z, x, y, amenity, now),
+                ).fetchone() is None
+            ]
+
+    def put_many(self, entries: Dict[Tuple[Tile, str], List[Dict[str, Any]]], ttls: Dict[str, int]) -> None:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO overpass_tiles (z, x, y, amenity, elements, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (z, x, y, amenity, json.dumps(els, separators=(",", ":")), now + ttls[amenity], now)
+                    for ((z, x, y), amenity), els in entries.items()
+                ],
+            )
+            conn.execute("DELETE FROM overpass_tiles WHERE expires_at <= ?", (now,))
+            conn.execute(
+                """
+                DELETE FROM overpass_tiles WHERE rowid IN (
+                    SELECT rowid FROM overpass_tiles ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+
+_TILE_CACHE: Optional[TileCache] = None
+
+
+def get_tile_cache() -> TileCache:
+    """Return the process-wide TileCache (created on first use)."""
+    global _TILE_CACHE
+    if _TILE_CACHE is None:
+        _TILE_CACHE = TileCache()
+    return _TILE_CACHE
@@ -1,23 +1,34 @@
 # api/routers/gemini/gemini_router.py
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
-import threading
+from typing import Optional, Dict, Any, Callable, Set, Tuple
+import asyncio
+import json
 import logging
 import importlib
+import os
+import time
 import traceback
+import uuid
+
+from api.common.session_store import DEFAULT_ROOM, get_session_store
+from api.gemini.jobs import DONE, ERROR, PENDING, GeminiJob, get_job_registry
+from api.gemini.parse_gemini_resp import StreamingFilterParser
 
 router = APIRouter()
 
-# Module-level variables (in-memory).
-# Note: these are process-local. Use persistent storage if you need durability or multi-instance sharing.
-USER_PROMPT_LOCK = threading.Lock()
-USER_PROMPT: Optional[str] = None
-USER_SYSTEM_PROMPT: Optional[str] = None  # store system prompt alongside user prompt if desired
+# Per-room state lives in the session store (api.common.session_store), under these fields:
+#   user_prompt, user_system_prompt  - the last submitted prompt pair
+#   gemini_response                  - the last completed Gemini output (or null)
+#   gemini_job                       - {"id", "status"} of the generation that will fill it
 
-GEMINI_RESPONSE_LOCK = threading.Lock()
-GEMINI_RESPONSE: Optional[str] = None
+# Upper bound for long-poll waits (seconds); SSE streams send a keep-alive comment this often.
+MAX_WAIT_S = 30.0
+SSE_KEEPALIVE_S = 15.0
+# How often a waiter re-reads the store for a job running in another worker/instance.
+STORE_POLL_S = float(os.environ.get("GEMINI_STORE_POLL_S", "0.25"))
 
 # Simple request model for setting a prompt
 class SetPromptRequest(BaseModel):
@@ -26,18 +37,12 @@ class SetPromptRequest(BaseModel):
     system_prompt: Optional[str] = None  # <-- now accepted from client
 
 
-@router.post("/set_prompt")
-def set_prompt(req: SetPromptRequest) -> Dict[str, Any]:
+def _save_prompt(room: str, req: SetPromptRequest, gemini_job: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
     """
-    Set the module-level USER_PROMPT (and optionally USER_SYSTEM_PROMPT) variable and immediately
-    attempt to call Gemini (via api.gemini.call_gemini.generate_response). The Gemini output is
-    stored in GEMINI_RESPONSE and can be retrieved via /get_response.
-
-    Note: either `prompt` or `system_prompt` must contain non-empty text. If both are empty, the
-    endpoint returns 400.
+    Validate and store the room's prompt/system prompt, clear its Gemini response and set its
+    `gemini_job` (none by default). Either `prompt` or `system_prompt` must contain non-empty
+    text (400 otherwise).
     """
-    global USER_PROMPT, USER_SYSTEM_PROMPT, GEMINI_RESPONSE
-
     # At least one of prompt or system_prompt must be provided and non-empty
     prompt_ok = isinstance(req.prompt, str) and req.prompt.strip() != ""
     system_ok = isinstance(req.system_prompt, str) and req.system_prompt.strip() != ""
@@ -49,161 +54,355 @@ def set_prompt(req: SetPromptRequest) -> Dict[str, Any]:
     user_prompt_val = req.prompt if isinstance(req.prompt, str) else ""
     user_system_prompt_val = req.system_prompt if isinstance(req.system_prompt, str) else ""
 
-    # Save prompt/system_prompt (thread-safe)
-    with USER_PROMPT_LOCK:
-        USER_PROMPT = user_prompt_val
-        USER_SYSTEM_PROMPT = user_system_prompt_val
+    # Save prompt/system_prompt and reset the previous gemini response
+    get_session_store().set(
+        room,
+        user_prompt=user_prompt_val,
+        user_system_prompt=user_system_prompt_val,
+        gemini_response=None,
+        gemini_job=gemini_job,
+    )
+    return user_prompt_val, user_system_prompt_val
 
-    # Reset previous gemini response
-    with GEMINI_RESPONSE_LOCK:
-        GEMINI_RESPONSE = None
 
-    # Try to import and call the provided call_gemini helper.
-    # We import dynamically and protect against SystemExit (call_gemini may call sys.exit if key missing).
+def _load_generate_fn() -> Tuple[Optional[Callable[..., Any]], Optional[str]]:
+    """
+    Import api.gemini.call_gemini and return (generate_response, None), or (None, error message).
+    We import dynamically and protect against SystemExit (call_gemini may call sys.exit if key missing).
+    """
     try:
         cg = importlib.import_module("api.gemini.call_gemini")
     except SystemExit:
         # call_gemini tried to sys.exit (likely missing GEMINI_API_KEY) — don't crash server
         logging.exception("api.gemini.call_gemini attempted to exit (likely missing GEMINI_API_KEY)")
-        return {
-            "status": "ok",
-            "saved_prompt_length": len(user_prompt_val),
-            "saved_system_prompt_length": len(user_system_prompt_val),
-            "gemini_called": False,
-            "error": "call_gemini attempted to exit (likely missing GEMINI_API_KEY). Check server logs."
-        }
+        return None, "call_gemini attempted to exit (likely missing GEMINI_API_KEY). Check server logs."
     except Exception as exc:
         logging.exception("Failed to import api.gemini.call_gemini")
         logging.debug(traceback.format_exc())
-        return {
-            "status": "ok",
-            "saved_prompt_length": len(user_prompt_val),
-            "saved_system_prompt_length": len(user_system_prompt_val),
-            "gemini_called": False,
-            "error": f"Import error: {str(exc)}"
-        }
+        return None, f"Import error: {str(exc)}"
 
-    # Ensure the module exposes generate_response
     generate_fn = getattr(cg, "generate_response", None)
-
     if not callable(generate_fn):
         logging.error("api.gemini.call_gemini.generate_response not found or not callable")
-        return {
-            "status": "ok",
-            "saved_prompt_length": len(user_prompt_val),
-            "saved_system_prompt_length": len(user_system_prompt_val),
-            "gemini_called": False,
-            "error": "generate_response not found in api.gemini.call_gemini"
-        }
+        return None, "generate_response not found in api.gemini.call_gemini"
+    return generate_fn, None
+
+
+def _job_info(job: GeminiJob) -> Dict[str, Any]:
+    """The `gemini_job` value stored for the room while/after `job` runs."""
+    info: Dict[str, Any] = {"id": job.id, "status": job.status}
+    if job.error:
+        info["error"] = job.error
+    return info
+
 
-    # Call the Gemini function (synchronously). Keep exceptions isolated.
+# Store writes for finished jobs, done from worker threads; kept referenced until they land.
+_PUBLISH_TASKS: Set[asyncio.Task] = set()
+
+
+async def _publish(room: str, finished: GeminiJob) -> None:
+    """Store a finished job's outcome for the room, unless a newer generation has replaced it."""
+    fields: Dict[str, Any] = {"gemini_job": _job_info(finished)}
+    if finished.error:
+        logging.error("Gemini generation failed: %s", finished.error)
+    else:
+        logging.debug("Gemini returned response length: %d", len(finished.response or ""))
+        fields["gemini_response"] = finished.response
     try:
-        # Choose system prompt precedence:
-        # - If the provided system_prompt is non-empty, use it
-        # - Otherwise, allow call_gemini to use an empty string (or its default behaviour)
-        system_prompt_to_use = user_system_prompt_val or ""
+        await asyncio.to_thread(get_session_store().set_if_job, room, finished.id, **fields)
+    except Exception:
+        logging.exception("Could not store Gemini job %s for room %s", finished.id, room)
 
-        # 🟢 DEBUGGING PRINT: Log that the Gemini call is starting
-        print(f"--- DEBUG: Calling Gemini with prompt length {len(user_prompt_val)} and system_prompt length {len(system_prompt_to_use)} ---")
 
-        # call_gemini.generate_response(system_prompt=..., prompt=..., model=...)
-        gemini_text = generate_fn(system_prompt=system_prompt_to_use, prompt=user_prompt_val)
+async def _start_job(
+    room: str, generate_fn: Callable[..., Any], system_prompt: str, prompt: str, model: Optional[str] = None
+) -> GeminiJob:
+    """Submit a background generation and make it the job whose result lands in the room's gemini_response."""
+    job = get_job_registry().submit(generate_fn, system_prompt=system_prompt, prompt=prompt, model=model)
+    await asyncio.to_thread(get_session_store().set, room, gemini_job={"id": job.id, "status": PENDING})
 
-        # Ensure we store a string (some wrappers return complex objects)
-        gemini_text_str = gemini_text if isinstance(gemini_text, str) else str(gemini_text)
+    def publish(finished: GeminiJob) -> None:
+        task = asyncio.create_task(_publish(room, finished))
+        _PUBLISH_TASKS.add(task)
+        task.add_done_callback(_PUBLISH_TASKS.discard)
 
-        # 🟢 DEBUGGING PRINT: Log the response length
-        print(f"--- DEBUG: Gemini returned response length: {len(gemini_text_str)} ---")
+    # registered once the job is recorded (runs at once if it has already finished)
+    job.add_done_callback(publish)
+    return job
 
-        with GEMINI_RESPONSE_LOCK:
-            GEMINI_RESPONSE = gemini_text_str
 
-        return {
-            "status": "ok",
-            "saved_prompt_length": len(user_prompt_val),
-            "saved_system_prompt_length": len(system_prompt_to_use),
-            "gemini_called": True,
-            "gemini_length": len(gemini_text_str),
-        }
-    except SystemExit:
-        # Protect against any unexpected sys.exit inside call_gemini
-        logging.exception("call_gemini requested process exit while generating response")
-        return {
-            "status": "ok",
-            "saved_prompt_length": len(user_prompt_val),
-            "saved_system_prompt_length": len(user_system_prompt_val),
-            "gemini_called": False,
-            "error": "call_gemini requested process exit. Check GEMINI_API_KEY and call_gemini implementation."
-        }
-    except Exception as exc:
-        logging.exception("Error while calling Gemini via call_gemini.generate_response")
-        logging.debug(traceback.format_exc())
+async def room_gemini_state(room: str = DEFAULT_ROOM, wait: float = 0.0) -> Dict[str, Any]:
+    """
+    The room's stored state, first waiting up to `wait` seconds for a generation that is still
+    running. A job in this process is awaited directly; one started by another worker or instance
+    (or a streamed generation) is followed by re-reading the shared store every STORE_POLL_S.
+    """
+    store = get_session_store()
+    state = await asyncio.to_thread(store.get_all, room)
+    deadline = time.monotonic() + wait
+    while True:
+        job_info = state.get("gemini_job") or {}
+        remaining = deadline - time.monotonic()
+        if job_info.get("status") != PENDING or remaining <= 0:
+            return state
+        job = get_job_registry().get(job_info.get("id", ""))
+        if job is not None:
+            if await job.wait(remaining):
+                # still the room's job, but its outcome may not have reached the store yet
+                state = {**state, "gemini_job": _job_info(job)}
+                if not job.error:
+                    state["gemini_response"] = job.response
+                return state
+        else:
+            await asyncio.sleep(min(STORE_POLL_S, remaining))
+        state = await asyncio.to_thread(store.get_all, room)
+
+
+async def current_response(room: str = DEFAULT_ROOM, wait: float = 0.0) -> Optional[str]:
+    """The room's Gemini response, first waiting up to `wait` seconds for a still-running job."""
+    return (await room_gemini_state(room, wait)).get("gemini_response")
+
+
+@router.post("/set_prompt")
+async def set_prompt(
+    req: SetPromptRequest,
+    room: str = Query(DEFAULT_ROOM, description="Room code"),
+    wait: float = Query(0.0, ge=0.0, le=MAX_WAIT_S, description="Seconds to wait for the Gemini result before returning"),
+) -> Dict[str, Any]:
+    """
+    Set the room's prompt (and optionally system prompt) and start a background Gemini generation
+    (via api.gemini.call_gemini.generate_response). Returns at once with a `job_id`; follow it
+    with GET /jobs/{job_id}?wait=... (long-poll) or GET /jobs/{job_id}/events (SSE). The output is
+    also stored for the room and can be retrieved via /get_response. Pass `wait` to hold the
+    request until the job finishes (or `wait` seconds pass).
+
+    Note: either `prompt` or `system_prompt` must contain non-empty text. If both are empty, the
+    endpoint returns 400.
+    """
+    user_prompt_val, user_system_prompt_val = await asyncio.to_thread(_save_prompt, room, req)
+
+    generate_fn, error = _load_generate_fn()
+    if generate_fn is None:
         return {
             "status": "ok",
             "saved_prompt_length": len(user_prompt_val),
             "saved_system_prompt_length": len(user_system_prompt_val),
             "gemini_called": False,
-            "error": f"Gemini generation failed: {str(exc)}"
+            "error": error,
         }
 
+    logging.debug(
+        "Calling Gemini with prompt length %d and system_prompt length %d", len(user_prompt_val), len(user_system_prompt_val)
+    )
+
+    job = await _start_job(room, generate_fn, system_prompt=user_system_prompt_val, prompt=user_prompt_val)
+    if wait > 0:
+        await job.wait(wait)
+
+    result: Dict[str, Any] = {
+        "status": "ok",
+        "saved_prompt_length": len(user_prompt_val),
+        "saved_system_prompt_length": len(user_system_prompt_val),
+        "gemini_called": True,
+        "job_id": job.id,
+        "job_status": job.status,
+    }
+    if job.response is not None:
+        result["gemini_length"] = len(job.response)
+    if job.error:
+        result["error"] = f"Gemini generation failed: {job.error}"
+    return result
+
 
 @router.get("/get_prompt")
-def get_prompt():
-    """Return the currently-stored USER_PROMPT and USER_SYSTEM_PROMPT (or null)."""
-    return {"prompt": USER_PROMPT, "system_prompt": USER_SYSTEM_PROMPT}
+def get_prompt(room: str = Query(DEFAULT_ROOM, description="Room code")):
+    """Return the room's stored prompt and system prompt (or null)."""
+    state = get_session_store().get_all(room)
+    return {"prompt": state.get("user_prompt"), "system_prompt": state.get("user_system_prompt")}
 
 
 @router.get("/get_response")
-def get_response():
-    """Return the currently-stored GEMINI response (or null)."""
-    return {"response": GEMINI_RESPONSE}
+async def get_response(
+    room: str = Query(DEFAULT_ROOM, description="Room code"),
+    wait: float = Query(0.0, ge=0.0, le=MAX_WAIT_S, description="Seconds to wait for a running job"),
+):
+    """
+    Return the room's stored Gemini response (or null). With `wait`, a generation that is still
+    running is awaited for up to that many seconds first (long-poll).
+    """
+    state = await room_gemini_state(room, wait)
+    job_info = state.get("gemini_job") or {}
+    return {
+        "response": state.get("gemini_response"),
+        "job_id": job_info.get("id"),
+        "job_status": job_info.get("status"),
+    }
 
 
 @router.post("/generate")
-def generate_from_current_prompt(model: Optional[str] = None, system_prompt: Optional[str] = None):
+async def generate_from_current_prompt(
+    model: Optional[str] = None,
+    system_prompt: Optional[str] = None,
+    room: str = Query(DEFAULT_ROOM, description="Room code"),
+    wait: float = Query(0.0, ge=0.0, le=MAX_WAIT_S, description="Seconds to wait for the Gemini result before returning"),
+):
     """
-    Trigger generation using the currently-stored USER_PROMPT and store to GEMINI_RESPONSE.
+    Start a background generation using the room's stored prompt; the result is stored for the
+    room. Returns the `job_id` to follow (see /set_prompt).
     Optionally pass `model` to override the call_gemini default. Pass `system_prompt` to override
     the previously-saved system prompt.
     """
-    global USER_PROMPT, GEMINI_RESPONSE, USER_SYSTEM_PROMPT
+    state = await asyncio.to_thread(get_session_store().get_all, room)
+    saved_prompt = state.get("user_prompt")
+    saved_system_prompt = state.get("user_system_prompt")
+    if not saved_prompt and not saved_system_prompt and not system_prompt:
+        raise HTTPException(status_code=400, detail="No prompt or system prompt set for this room")
+
+    generate_fn, error = _load_generate_fn()
+    if generate_fn is None:
+        raise HTTPException(status_code=500, detail=error or "Gemini client not configured")
+
+    # system_prompt preference:
+    # 1. argument `system_prompt` if provided
+    # 2. the room's saved system prompt if available
+    # 3. empty string fallback
+    sp = system_prompt if isinstance(system_prompt, str) and system_prompt.strip() != "" else (saved_system_prompt or "")
+    prompt_to_use = saved_prompt or ""
+
+    job = await _start_job(room, generate_fn, system_prompt=sp, prompt=prompt_to_use, model=model)
+    if wait > 0:
+        await job.wait(wait)
+    if job.error:
+        raise HTTPException(status_code=500, detail=job.error)
 
-    if not USER_PROMPT and not USER_SYSTEM_PROMPT and not system_prompt:
-        raise HTTPException(status_code=400, detail="No USER_PROMPT or USER_SYSTEM_PROMPT set")
+    result: Dict[str, Any] = {"status": "ok", "job_id": job.id, "job_status": job.status}
+    if job.response is not None:
+        result["gemini_length"] = len(job.response)
+    return result
+
+
+# ---------- job completion: long-poll and Server-Sent Events ----------
+def _sse(name: str, payload: Dict[str, Any]) -> str:
+    return f"event: {name}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+def _get_job_or_404(job_id: str) -> GeminiJob:
+    job = get_job_registry().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0.0, ge=0.0, le=MAX_WAIT_S, description="Seconds to wait for completion")):
+    """
+    Job status and, once finished, its response or error. With `wait`, long-polls for completion.
+    Jobs live in the worker that started them; behind several workers use /get_response?room=...
+    """
+    job = _get_job_or_404(job_id)
+    if wait > 0:
+        await job.wait(wait)
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events for one job: a `status` event straight away, keep-alive comments while it
+    runs, then a single `done` or `error` event carrying the job (same shape as GET /jobs/{job_id}).
+    """
+    job = _get_job_or_404(job_id)
+
+    async def events():
+        yield _sse("status", job.to_dict())
+        while not await job.wait(SSE_KEEPALIVE_S):
+            yield ": keep-alive\n\n"
+        yield _sse("error" if job.error else "done", job.to_dict())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------- streaming generation ----------
+@router.post("/stream")
+async def stream_prompt(req: SetPromptRequest, model: Optional[str] = None, room: str = Query(DEFAULT_ROOM, description="Room code")):
+    """
+    Save the prompt like /set_prompt, then stream the Gemini output as Server-Sent Events:
+
+      - `chunk`   {"text": ...} for every piece of text the model produces;
+      - `filters` {"filters": ["amenity=...", ...]} once, as soon as a complete list has arrived,
+        so the client can start the Overpass search before the model has finished;
+      - `done`    {"response": ..., "filters": [...]} at the end (also stored for the room);
+      - `error`   {"error": ...} if generation fails.
+
+    While it runs the room's `gemini_job` is {"id": <stream id>, "status": "pending"}, so
+    /get_response?wait=... and the map search wait for it. The response is stored only if no
+    newer prompt has been submitted for the room in the meantime.
+    Read it with fetch() and a stream reader (EventSource cannot POST).
+    """
+    stream_id = uuid.uuid4().hex
+    user_prompt_val, user_system_prompt_val = await asyncio.to_thread(
+        _save_prompt, room, req, {"id": stream_id, "status": PENDING}
+    )
+    store = get_session_store()
+
+    def fail(error: str) -> None:
+        # in a task of its own: the stream may be closing (client gone) when this runs
+        task = asyncio.create_task(asyncio.to_thread(
+            store.set_if_job, room, stream_id, gemini_job={"id": stream_id, "status": ERROR, "error": error}
+        ))
+        _PUBLISH_TASKS.add(task)
+        task.add_done_callback(_PUBLISH_TASKS.discard)
 
-    # Import call_gemini dynamically as above
     try:
         cg = importlib.import_module("api.gemini.call_gemini")
     except SystemExit:
         logging.exception("api.gemini.call_gemini attempted to exit (likely missing GEMINI_API_KEY)")
+        fail("Gemini client not configured")
         raise HTTPException(status_code=500, detail="Gemini client not configured")
     except Exception as exc:
         logging.exception("Failed to import api.gemini.call_gemini")
+        fail(f"Import error: {str(exc)}")
         raise HTTPException(status_code=500, detail=f"Import error: {str(exc)}")
-
-    generate_fn = getattr(cg, "generate_response", None)
-
-    if not callable(generate_fn):
-        logging.error("api.gemini.call_gemini.generate_response not found or not callable")
-        raise HTTPException(status_code=500, detail="generate_response not available")
-
-    try:
-        # system_prompt preference:
-        # 1. argument `system_prompt` if provided
-        # 2. saved USER_SYSTEM_PROMPT if available
-        # 3. empty string fallback
-        sp = system_prompt if isinstance(system_prompt, str) and system_prompt.strip() != "" else (USER_SYSTEM_PROMPT or "")
-
-        prompt_to_use = USER_PROMPT or ""
-
-        if model:
-            gemini_text = generate_fn(system_prompt=sp, prompt=prompt_to_use, model=model)
-        else:
-            gemini_text = generate_fn(system_prompt=sp, prompt=prompt_to_use)
-        gemini_text_str = gemini_text if isinstance(gemini_text, str) else str(gemini_text)
-        with GEMINI_RESPONSE_LOCK:
-            GEMINI_RESPONSE = gemini_text_str
-        return {"status": "ok", "gemini_length": len(gemini_text_str)}
-    except Exception as exc:
-        logging.exception("Gemini generation failed")
-        raise HTTPException(status_code=500, detail=str(exc))
+    stream_fn = getattr(cg, "stream_response", None)
+    if not callable(stream_fn):
+        fail("stream_response not available")
+        raise HTTPException(status_code=500, detail="stream_response not available")
+
+    kwargs: Dict[str, Any] = {"system_prompt": user_system_prompt_val, "prompt": user_prompt_val}
+    if model:
+        kwargs["model"] = model
+
+    async def events():
+        parser = StreamingFilterParser()
+        try:
+            async for text in stream_fn(**kwargs):
+                yield _sse("chunk", {"text": text})
+                filters = parser.feed(text)
+                if filters is not None:
+                    yield _sse("filters", {"filters": filters})
+        except Exception as exc:
+            logging.exception("Gemini streaming failed")
+            fail(str(exc))
+            yield _sse("error", {"error": str(exc)})
+            return
+        except BaseException:
+            fail("stream closed before the response was complete")
+            raise
+
+        if parser.filters is None:
+            yield _sse("filters", {"filters": parser.finish()})
+        await asyncio.to_thread(
+            store.set_if_job, room, stream_id,
+            gemini_response=parser.text, gemini_job={"id": stream_id, "status": DONE},
+        )
+        yield _sse("done", {"response": parser.text, "filters": parser.filters})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
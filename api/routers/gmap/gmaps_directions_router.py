@@ -1,16 +1,15 @@
+import asyncio
 import os
-import requests
-import polyline
+import httpx
 from fastapi import APIRouter, HTTPException, Body
-from pydantic import BaseModel
-from typing import List, Tuple, Optional, Dict, Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Tuple, Optional
 
-router = APIRouter()
+from api.gmap.directions import GMAPS_API_KEY, DirectionsError, get_routes
+from api.gmap.polyline_codec import decode_polyline, encode_polyline, simplify_for_zoom
 
-# --- Configuration ---
-# You MUST set this environment variable for the router to work
-GMAPS_API_KEY = os.environ.get("GMAPS_API_KEY", "YOUR_GOOGLE_MAPS_API_KEY_HERE")
-GMAPS_DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+router = APIRouter()
 
 # --- Request/Response Schemas ---
 
@@ -24,13 +23,80 @@ class ComputeRoutesRequest(BaseModel):
     origin: LatLng
     destination: LatLng
     travel_mode: str = "DRIVING"
+    # "coords": decoded [lat, lon] pairs in `polyline`; "encoded": Google's string in `encoded_polyline`
+    polyline_format: Literal["coords", "encoded"] = "coords"
+    # Simplify the geometry for display at this web-map zoom level (None: full overview geometry)
+    zoom: Optional[float] = Field(None, ge=0, le=22)
 
 class ComputeRoutesResponse(BaseModel):
     """Schema matching the required front-end response."""
-    polyline: List[Tuple[float, float]] # List of [lat, lon] pairs
+    polyline: Optional[List[Tuple[float, float]]] = None # List of [lat, lon] pairs
+    encoded_polyline: Optional[str] = None
     distance_meters: Optional[int]
     duration_seconds: Optional[int]
 
+class RouteMatrixRequest(BaseModel):
+    """Many origins (e.g. every participant) to one or more destinations."""
+    origins: List[LatLng]
+    destinations: List[LatLng]
+    travel_mode: str = "DRIVING"
+    zoom: Optional[float] = Field(None, ge=0, le=22)
+
+class RouteMatrixCell(BaseModel):
+    """One origin -> destination route; polyline is Google's encoded overview polyline."""
+    origin_index: int
+    destination_index: int
+    status: str
+    polyline: Optional[str] = None
+    distance_meters: Optional[int] = None
+    duration_seconds: Optional[int] = None
+
+class RouteMatrixResponse(BaseModel):
+    """distance_meters[i][j] / duration_seconds[i][j] are for origins[i] -> destinations[j] (null on failure)."""
+    distance_meters: List[List[Optional[int]]]
+    duration_seconds: List[List[Optional[int]]]
+    routes: List[RouteMatrixCell]
+
+class MultiModeRoutesRequest(BaseModel):
+    """One origin/destination pair, several travel modes compared in one call."""
+    origin: LatLng
+    destination: LatLng
+    travel_modes: List[str] = ["DRIVING", "WALKING", "TRANSIT"]
+    alternatives: bool = False
+    polyline_format: Literal["coords", "encoded"] = "encoded"
+    zoom: Optional[float] = Field(None, ge=0, le=22)
+
+class ModeRoute(BaseModel):
+    polyline: Optional[List[Tuple[float, float]]] = None
+    encoded_polyline: Optional[str] = None
+    distance_meters: Optional[int] = None
+    duration_seconds: Optional[int] = None
+    summary: Optional[str] = None
+
+class ModeRoutes(BaseModel):
+    """Routes for one travel mode; status is "OK" or the Directions/upstream error."""
+    status: str
+    routes: List[ModeRoute] = []
+
+class MultiModeRoutesResponse(BaseModel):
+    modes: Dict[str, ModeRoutes]
+
+# Matrix requests: cap on origin x destination pairs and on concurrent Directions calls
+MATRIX_MAX_ELEMENTS = int(os.environ.get("DIRECTIONS_MATRIX_MAX_ELEMENTS", "100"))
+MATRIX_CONCURRENCY = int(os.environ.get("DIRECTIONS_MATRIX_CONCURRENCY", "8"))
+
+# --- Geometry formatting ---
+
+def _route_geometry(encoded: str, polyline_format: str, zoom: Optional[float]) -> Dict[str, Any]:
+    """`polyline`/`encoded_polyline` fields for a route, simplified for `zoom` when given."""
+    if polyline_format == "encoded" and zoom is None:
+        # pass Google's string through untouched
+        return {"polyline": None, "encoded_polyline": encoded}
+    coords = simplify_for_zoom(decode_polyline(encoded), zoom)
+    if polyline_format == "encoded":
+        return {"polyline": None, "encoded_polyline": encode_polyline(coords)}
+    return {"polyline": coords.tolist(), "encoded_polyline": None}
+
 # --- Router Endpoint ---
 
 @router.post("/compute-routes", response_model=ComputeRoutesResponse)
@@ -44,64 +110,142 @@ async def compute_routes(req: ComputeRoutesRequest = Body(...)):
             status_code=500, detail="GMAPS_API_KEY environment variable not set."
         )
 
-    # Convert Pydantic models to strings for the Directions API request
-    origin_str = f"{req.origin.lat},{req.origin.lng}"
-    destination_str = f"{req.destination.lat},{req.destination.lng}"
-    
-    params = {
-        "origin": origin_str,
-        "destination": destination_str,
-        "mode": req.travel_mode.lower(),
-        "key": GMAPS_API_KEY,
-    }
+    origin = (req.origin.lat, req.origin.lng)
+    destination = (req.destination.lat, req.destination.lng)
 
     try:
-        # 1. Call the external Google Directions API
-        response = requests.get(GMAPS_DIRECTIONS_URL, params=params)
-        response.raise_for_status() # Raise exception for bad status codes
-        data = response.json()
-
-        # 2. Extract necessary data from the first route found
-        if data["status"] != "OK":
-            # IMPROVED ERROR HANDLING: Catch status codes like ZERO_RESULTS, NOT_FOUND, etc.
-            status = data.get("status", "UNKNOWN_ERROR")
-            detail = data.get("error_message", f"Route calculation failed with status: {status}")
-            
-            # Use 400 Bad Request if the parameters/input failed, otherwise 503 Service Unavailable
-            http_status = 400 if status in ["ZERO_RESULTS", "NOT_FOUND", "INVALID_REQUEST"] else 503
-            
-            raise HTTPException(
-                status_code=http_status, 
-                detail=f"Google Directions API Error: {detail}"
-            )
-            
-        if not data["routes"]:
-             # This handles the case where status is OK but routes list is empty (should be caught by ZERO_RESULTS but is safer)
+        # 1. Served from the route cache (origin/destination snapped to a ~50 m grid) when possible;
+        #    otherwise one async Directions call shared by concurrent identical requests
+        routes = await get_routes(origin, destination, req.travel_mode)
+
+        if not routes:
+            # This handles the case where status is OK but routes list is empty (should be caught by ZERO_RESULTS but is safer)
             raise HTTPException(
                 status_code=404, 
                 detail="Google Directions API Error: Route calculated but result set was empty."
             )
 
-        route = data["routes"][0]
-        leg = route["legs"][0]
-
-        # Google returns the polyline as an encoded string. We must decode it.
-        encoded_polyline = route["overview_polyline"]["points"]
-        
-        # Decode the polyline string into a list of [lat, lon] tuples
-        decoded_coords = polyline.decode(encoded_polyline)
-
-        # 3. Format response for the front-end
-        return ComputeRoutesResponse(
-            # Leaflet expects [[lat, lon], ...]
-            polyline=decoded_coords, 
-            distance_meters=leg["distance"]["value"],
-            duration_seconds=leg["duration"]["value"],
-        )
+        route = routes[0]
+
+        # 2. Format response for the front-end. Google returns the polyline as an encoded string;
+        #    it is passed through, or decoded (vectorized) into [[lat, lon], ...] for Leaflet.
+        #    Built as plain JSON: validating thousands of points one by one is the slow part.
+        return JSONResponse({
+            **_route_geometry(route["polyline"], req.polyline_format, req.zoom),
+            "distance_meters": route["distance_meters"],
+            "duration_seconds": route["duration_seconds"],
+        })
 
-    except requests.exceptions.HTTPError as e:
-        # Catch network or non-200 errors from Google (e.g., 403 Forbidden due to bad API key)
+    except HTTPException:
+        raise
+    except DirectionsError as e:
+        # IMPROVED ERROR HANDLING: Catch status codes like ZERO_RESULTS, NOT_FOUND, etc.
+        # Use 400 Bad Request if the parameters/input failed, otherwise 503 Service Unavailable
+        http_status = 400 if e.status in ["ZERO_RESULTS", "NOT_FOUND", "INVALID_REQUEST"] else 503
+        raise HTTPException(status_code=http_status, detail=f"Google Directions API Error: {e}")
+    except httpx.HTTPStatusError as e:
+        # Catch non-200 errors from Google (e.g., 403 Forbidden due to bad API key)
         raise HTTPException(status_code=e.response.status_code, detail=f"Google API call failed: {e}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Google API call failed: {e}")
     except Exception as e:
         # Catch any other unexpected Python errors
         raise HTTPException(status_code=500, detail=f"Internal server error during routing: {e}")
+
+
+@router.post("/compute-routes/matrix", response_model=RouteMatrixResponse)
+async def compute_routes_matrix(req: RouteMatrixRequest = Body(...)):
+    """
+    Computes routes from every origin to every destination concurrently (behind the route cache)
+    and returns compact encoded polylines plus distance and duration matrices. A failed pair is
+    reported in its cell's status and leaves null in the matrices instead of failing the request.
+    """
+    if not GMAPS_API_KEY:
+        raise HTTPException(
+            status_code=500, detail="GMAPS_API_KEY environment variable not set."
+        )
+    if not req.origins or not req.destinations:
+        raise HTTPException(status_code=400, detail="At least one origin and one destination are required.")
+    if len(req.origins) * len(req.destinations) > MATRIX_MAX_ELEMENTS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MATRIX_MAX_ELEMENTS} origin/destination pairs per request."
+        )
+
+    semaphore = asyncio.Semaphore(MATRIX_CONCURRENCY)
+
+    async def route_cell(i: int, j: int) -> RouteMatrixCell:
+        origin, destination = req.origins[i], req.destinations[j]
+        try:
+            async with semaphore:
+                routes = await get_routes((origin.lat, origin.lng), (destination.lat, destination.lng), req.travel_mode)
+        except DirectionsError as e:
+            return RouteMatrixCell(origin_index=i, destination_index=j, status=e.status)
+        except httpx.HTTPError as e:
+            return RouteMatrixCell(origin_index=i, destination_index=j, status=f"UPSTREAM_ERROR: {e}")
+        if not routes:
+            return RouteMatrixCell(origin_index=i, destination_index=j, status="ZERO_RESULTS")
+        route = routes[0]
+        return RouteMatrixCell(
+            origin_index=i,
+            destination_index=j,
+            status="OK",
+            polyline=_route_geometry(route["polyline"], "encoded", req.zoom)["encoded_polyline"],
+            distance_meters=route["distance_meters"],
+            duration_seconds=route["duration_seconds"],
+        )
+
+    cells = await asyncio.gather(
+        *(route_cell(i, j) for i in range(len(req.origins)) for j in range(len(req.destinations)))
+    )
+
+    distances = [[None] * len(req.destinations) for _ in req.origins]
+    durations = [[None] * len(req.destinations) for _ in req.origins]
+    for cell in cells:
+        distances[cell.origin_index][cell.destination_index] = cell.distance_meters
+        durations[cell.origin_index][cell.destination_index] = cell.duration_seconds
+
+    return RouteMatrixResponse(distance_meters=distances, duration_seconds=durations, routes=list(cells))
+
+
+@router.post("/compute-routes/modes", response_model=MultiModeRoutesResponse)
+async def compute_routes_multi_mode(req: MultiModeRoutesRequest = Body(...)):
+    """
+    Computes routes for several travel modes (optionally with alternatives) between one origin
+    and destination concurrently, so comparing modes costs about as long as the slowest mode.
+    Each mode uses the same route cache entries as /compute-routes. A failing mode is reported
+    in its status instead of failing the request.
+    """
+    if not GMAPS_API_KEY:
+        raise HTTPException(
+            status_code=500, detail="GMAPS_API_KEY environment variable not set."
+        )
+    modes = list(dict.fromkeys(m.strip().upper() for m in req.travel_modes if m.strip()))
+    if not modes:
+        raise HTTPException(status_code=400, detail="At least one travel mode is required.")
+
+    origin = (req.origin.lat, req.origin.lng)
+    destination = (req.destination.lat, req.destination.lng)
+
+    async def mode_routes(mode: str) -> Dict[str, Any]:
+        try:
+            routes = await get_routes(origin, destination, mode, req.alternatives)
+        except DirectionsError as e:
+            return {"status": e.status, "routes": []}
+        except httpx.HTTPError as e:
+            return {"status": f"UPSTREAM_ERROR: {e}", "routes": []}
+        return {
+            "status": "OK" if routes else "ZERO_RESULTS",
+            "routes": [
+                {
+                    **_route_geometry(route["polyline"], req.polyline_format, req.zoom),
+                    "distance_meters": route["distance_meters"],
+                    "duration_seconds": route["duration_seconds"],
+                    "summary": route.get("summary"),
+                }
+                for route in routes
+            ],
+        }
+
+    results = await asyncio.gather(*(mode_routes(m) for m in modes))
+    # plain JSON for the same reason as /compute-routes
+    return JSONResponse({"modes": dict(zip(modes, results))})
@@ -1,7 +1,11 @@
+import asyncio
+import logging
+import os
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from gmap.call_gmaps import call_gmaps
+from typing import Optional, Dict, Any, List, Set, Tuple, Union
+from api.gmap.call_gmaps import call_gmaps_async
+from api.gmap.place_cache import normalize_field_groups
 
 router = APIRouter()
 
@@ -11,9 +15,25 @@ class GMapSearchRequest(BaseModel):
     lng: float
     radius: Optional[int] = 100
 
+
+class GMapBatchItem(BaseModel):
+    id: Union[str, int]
+    name: str
+    lat: float
+    lng: float
+    radius: Optional[int] = 100
+
+# Batch lookups: cap on items per request and on concurrent Google lookups per batch
+BATCH_MAX_ITEMS = int(os.environ.get("GMAPS_BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.environ.get("GMAPS_BATCH_CONCURRENCY", "8"))
+BATCH_DEADLINE_S = float(os.environ.get("GMAPS_BATCH_DEADLINE_S", "10"))
+
+# Batch lookups still running (or queued) at the deadline; kept referenced until they finish.
+_BACKGROUND_TASKS: Set[asyncio.Task] = set()
+
 # FIX 1: Changed path from "/gmap/search" to "/search"
 @router.get("/search") 
-def gmap_search_get(
+async def gmap_search_get(
     name: str = Query(..., description="Place name to search for"),
     lat: float = Query(..., description="Latitude"),
     lng: float = Query(..., description="Longitude"),
@@ -23,8 +43,9 @@ def gmap_search_get(
     Search for a place via Google Maps using query parameters.
     """
     try:
-        result = call_gmaps(name, lat, lng, radius)
-        if not result:
+        # identical concurrent lookups (e.g. everyone in a room) share one Google call
+        result = await call_gmaps_async(name, lat, lng, radius)
+        if result is None:
             raise HTTPException(status_code=404, detail="Place not found")
         return result
     except Exception as e:
@@ -32,14 +53,92 @@ def gmap_search_get(
 
 # FIX 2: Changed path from "/gmap/search" to "/search"
 @router.post("/search")
-def gmap_search_post(payload: GMapSearchRequest):
+async def gmap_search_post(payload: GMapSearchRequest):
     """
     Search for a place via Google Maps using JSON body.
     """
     try:
-        result = call_gmaps(payload.name, payload.lat, payload.lng, payload.radius)
-        if not result:
+        result = await call_gmaps_async(payload.name, payload.lat, payload.lng, payload.radius)
+        if result is None:
             raise HTTPException(status_code=404, detail="Place not found")
         return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _detach_done(task: asyncio.Task) -> None:
+    _BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning("Background Google Maps lookup failed: %s", task.exception())
+
+
+@router.post("/search/batch")
+async def gmap_search_batch(
+    payload: List[GMapBatchItem],
+    deadline_s: float = Query(BATCH_DEADLINE_S, gt=0, description="Overall deadline in seconds; unfinished lookups are reported as timeouts"),
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=32, description="Max concurrent Google Maps lookups"),
+    fields: str = Query("basic,rating,reviews", description="Place detail field groups: basic, rating, reviews"),
+):
+    """
+    Look up many places in one request (e.g. every place selected in a room).
+
+    Items asking for the same place (same name, location ~1 m, radius) share one lookup; an `id`
+    used for two different places is rejected with 400. Returns
+    {"results": {id: {...}}, "partial": bool} where each entry has a "status" of "ok" (with the
+    Google "result"), "not_found", "error" (with "detail") or "timeout" (lookup unfinished at the
+    deadline, including ones still queued; it keeps running in the background and warms the
+    cache for the next request).
+    """
+    if len(payload) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch.")
+    try:
+        field_groups = normalize_field_groups(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # de-duplicate: one lookup per distinct place, fanned back out to every id asking for it
+    ids_by_key: Dict[Tuple[str, float, float, int], List[str]] = {}
+    items_by_key: Dict[Tuple[str, float, float, int], GMapBatchItem] = {}
+    key_by_id: Dict[str, Tuple[str, float, float, int]] = {}
+    for item in payload:
+        radius = item.radius or 100
+        key = (item.name.strip().lower(), round(item.lat, 5), round(item.lng, 5), radius)
+        item_id = str(item.id)
+        if key_by_id.setdefault(item_id, key) != key:
+            raise HTTPException(status_code=400, detail=f"Duplicate id {item_id!r} used for different places.")
+        if item_id not in ids_by_key.setdefault(key, []):
+            ids_by_key[key].append(item_id)
+        items_by_key.setdefault(key, item)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(item: GMapBatchItem) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            return await call_gmaps_async(
+                item.name, item.lat, item.lng, item.radius or 100, field_groups=field_groups
+            )
+
+    tasks = {key: asyncio.create_task(lookup(item)) for key, item in items_by_key.items()}
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=deadline_s)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    partial = False
+    for key, task in tasks.items():
+        if not task.done():
+            # let it finish detached (queued ones included) so its result still warms the cache
+            _BACKGROUND_TASKS.add(task)
+            task.add_done_callback(_detach_done)
+            partial = True
+            entry: Dict[str, Any] = {"status": "timeout"}
+        elif task.exception() is not None:
+            logging.warning("Batch Google Maps lookup failed for %r: %s", key[0], task.exception())
+            entry = {"status": "error", "detail": str(task.exception())}
+        elif task.result() is None:
+            entry = {"status": "not_found"}
+        else:
+            entry = {"status": "ok", "result": task.result()}
+        for item_id in ids_by_key[key]:
+            results[item_id] = entry
+
+    return {"results": results, "partial": partial}
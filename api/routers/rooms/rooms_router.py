@@ -0,0 +1,225 @@
+# api/routers/rooms/rooms_router.py
+"""
+One-shot room search: polygon + prompt in, staged results out.
+
+The map page used to chain set_sample -> set_prompt -> /api/map/search -> one Places lookup per
+result, each a separate round trip. POST /api/rooms/{code}/search runs the same stages as a
+pipeline inside one request:
+
+  1. Gemini turns the prompt into amenity filters (streamed; filters are taken as soon as a
+     complete list has arrived). Meanwhile the Overpass query for the fallback `amenity` starts
+     speculatively.
+  2. If Gemini's filters are just the fallback (or Gemini gives nothing usable within
+     SEARCH_WAIT_S) the speculative result is used; otherwise it is cancelled and the filtered
+     query runs.
+  3. The top `top_n` elements are enriched on Google Maps concurrently, each result sent as
+     soon as it is ready.
+
+The response is NDJSON, one object per line with a `stage` of "filters", "overpass", "place",
+"done" (or "error"), each carrying `elapsed_ms` since the request started. The polygon, prompt
+and (once complete) Gemini response are also stored for the room, so the per-step endpoints
+see the same state; the response is dropped if a newer prompt or search has replaced this one.
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from api.common.session_store import get_session_store
+from api.gemini.jobs import DONE, ERROR, PENDING, SEARCH_WAIT_S
+from api.gemini.parse_gemini_resp import StreamingFilterParser
+from api.gmap.enrich import ENRICH_CONCURRENCY, ENRICH_DEADLINE_S, enrich_element, parse_field_groups
+from api.map.leaflet_to_overpass import normalize_amenity_filters
+from api.map.overpass_cache import canonical_amenities
+from api.map.overpass_search import search_elements_multi
+
+router = APIRouter()
+
+# Gemini generations that outlive the request that started them (the stream has moved on once
+# filters are known); kept referenced until they have stored the room's full response.
+_BACKGROUND_TASKS: Set[asyncio.Task] = set()
+
+
+class RoomSearchRequest(BaseModel):
+    polygon: List[Dict[str, float]] = Field(..., description="Polygon vertices as [{lat, lng}, ...]")
+    prompt: str = Field("", description="What the group is looking for")
+    system_prompt: str = Field("", description="System prompt for the amenity classifier")
+    amenity: str = Field("restaurant", min_length=1, description="Fallback amenity, searched speculatively")
+    top_n: int = Field(3, ge=0, le=50, description="How many results to enrich on Google Maps")
+    reviews_n: int = Field(2, ge=0, description="How many reviews to return per place")
+    fields: str = Field("basic,rating,reviews", description="Place detail field groups: basic, rating, reviews")
+    concurrency: int = Field(ENRICH_CONCURRENCY, ge=1, le=32, description="Max concurrent Google Maps lookups")
+    deadline_s: float = Field(ENRICH_DEADLINE_S, gt=0, description="Per-element Google Maps lookup deadline in seconds")
+    model: Optional[str] = None
+
+
+def _polygon_coords(points: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    """[{lat, lng}] in the set_sample shape; accepts lng/lon/longitude and lat/latitude keys."""
+    coords = []
+    for p in points:
+        lat = p.get("lat", p.get("latitude"))
+        lon = p.get("lng", p.get("lon", p.get("longitude")))
+        if lat is not None and lon is not None:
+            coords.append({"lat": float(lat), "lng": float(lon)})
+    return coords
+
+
+def _line(stage: str, started: float, **payload: Any) -> str:
+    record = {"stage": stage, "elapsed_ms": round((time.monotonic() - started) * 1000, 1), **payload}
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+async def _gemini_filters(
+    room: str,
+    stream_id: str,
+    system_prompt: str,
+    prompt: str,
+    model: Optional[str],
+    filters_ready: "asyncio.Future[Optional[List[str]]]",
+) -> None:
+    """
+    Stream Gemini's answer, resolve `filters_ready` with the amenity filters as soon as a complete
+    list has arrived, and store the full response for the room at the end, unless the room's
+    gemini_job is no longer `stream_id` (a newer prompt or search has replaced it). A failure
+    resolves `filters_ready` with None (the pipeline then uses the fallback amenity).
+    """
+    store = get_session_store()
+    parser = StreamingFilterParser()
+
+    def resolve(filters: List[str]) -> None:
+        if not filters_ready.done():
+            filters_ready.set_result([f.strip() for f in filters if isinstance(f, str) and f.strip().startswith("amenity=")])
+
+    try:
+        cg = importlib.import_module("api.gemini.call_gemini")
+        kwargs: Dict[str, Any] = {"system_prompt": system_prompt, "prompt": prompt}
+        if model:
+            kwargs["model"] = model
+        async for text in cg.stream_response(**kwargs):
+            filters = parser.feed(text)
+            if filters is not None:
+                resolve(filters)
+        resolve(parser.finish())
+        await asyncio.to_thread(
+            store.set_if_job, room, stream_id, gemini_response=parser.text, gemini_job={"id": stream_id, "status": DONE}
+        )
+    except (Exception, SystemExit) as exc:  # call_gemini may sys.exit when GEMINI_API_KEY is missing
+        logging.warning("Gemini stage failed for room %s: %s", room, exc)
+        if not filters_ready.done():
+            filters_ready.set_result(None)
+        await asyncio.to_thread(
+            store.set_if_job, room, stream_id, gemini_job={"id": stream_id, "status": ERROR, "error": str(exc)}
+        )
+
+
+async def _room_pipeline(
+    room: str, stream_id: Optional[str], req: RoomSearchRequest, coords: List[Dict[str, float]]
+) -> AsyncIterator[str]:
+    started = time.monotonic()
+    polygons: List[List[Tuple[float, float]]] = [[(c["lat"], c["lng"]) for c in coords]]
+    fallback = canonical_amenities(normalize_amenity_filters(req.amenity.strip()))
+    field_groups = parse_field_groups(req.fields, req.reviews_n)
+
+    # stage 1: Gemini filters and the speculative fallback search, side by side
+    speculative = asyncio.ensure_future(search_elements_multi(polygons, fallback))
+    # if it is discarded, its outcome is of no interest (retrieve it so asyncio does not warn)
+    speculative.add_done_callback(lambda t: t.cancelled() or t.exception())
+    filters_ready: "asyncio.Future[Optional[List[str]]]" = asyncio.get_running_loop().create_future()
+    if stream_id is not None:
+        gemini = asyncio.create_task(
+            _gemini_filters(room, stream_id, req.system_prompt, req.prompt, req.model, filters_ready)
+        )
+        _BACKGROUND_TASKS.add(gemini)
+        gemini.add_done_callback(_BACKGROUND_TASKS.discard)
+    else:
+        filters_ready.set_result([])
+
+    # the speculative search is cancelled unless it is used, including when the client leaves
+    # after the filters line or stage 2 fails
+    reused = False
+    try:
+        error: Optional[str] = None
+        try:
+            filters = await asyncio.wait_for(asyncio.shield(filters_ready), SEARCH_WAIT_S)
+        except asyncio.TimeoutError:
+            filters, error = [], f"Gemini gave no filters within {SEARCH_WAIT_S}s"
+        if filters is None:
+            filters, error = [], "Gemini unavailable (see server logs)"
+        source = "gemini" if filters else "fallback"
+        payload: Dict[str, Any] = {"filters": filters or fallback, "source": source}
+        if error:
+            payload["error"] = error
+        yield _line("filters", started, **payload)
+
+        # stage 2: Overpass (the speculative result when the filters come to the same thing)
+        try:
+            if not filters or canonical_amenities(normalize_amenity_filters(filters)) == fallback:
+                elements = await speculative
+                reused = True
+            else:
+                speculative.cancel()
+                elements = await search_elements_multi(polygons, filters)
+        except Exception as exc:
+            logging.exception("Overpass stage failed for room %s", room)
+            yield _line("error", started, error=str(exc))
+            return
+    finally:
+        if not reused:
+            speculative.cancel()
+    yield _line("overpass", started, elements=elements, speculative=reused)
+
+    # stage 3: Google Maps enrichment, streamed in completion order
+    semaphore = asyncio.Semaphore(req.concurrency)
+
+    async def enrich(index: int, el: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        async with semaphore:
+            return index, await enrich_element(el, req.reviews_n, req.deadline_s, field_groups)
+
+    pending = [asyncio.ensure_future(enrich(i, el)) for i, el in enumerate(elements[:req.top_n])]
+    try:
+        for next_done in asyncio.as_completed(pending):
+            index, result = await next_done
+            yield _line("place", started, index=index, result=result)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    yield _line("done", started, elements=len(elements), places=len(pending))
+
+
+@router.post("/{code}/search")
+async def room_search(code: str, req: RoomSearchRequest):
+    """
+    Store the room's polygon and prompt, then stream the pipelined search results as NDJSON
+    (see the module docstring for the stages).
+    """
+    coords = _polygon_coords(req.polygon)
+    if len(coords) < 3:
+        raise HTTPException(status_code=400, detail="At least three valid lat/lng points are required.")
+    if not req.amenity.strip():
+        raise HTTPException(status_code=400, detail="'amenity' must not be blank.")
+    try:
+        parse_field_groups(req.fields, req.reviews_n)  # reject bad field groups before streaming starts
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # the Gemini stream is the room's job while it runs (map searches wait for it)
+    stream_id = uuid.uuid4().hex if req.prompt.strip() or req.system_prompt.strip() else None
+    await asyncio.to_thread(
+        get_session_store().set,
+        code,
+        sample_data=[{"id": None, "latlngs": {"0": coords}}],
+        user_prompt=req.prompt,
+        user_system_prompt=req.system_prompt,
+        gemini_response=None,
+        gemini_job={"id": stream_id, "status": PENDING} if stream_id else None,
+    )
+    return StreamingResponse(_room_pipeline(code, stream_id, req, coords), media_type="application/x-ndjson")
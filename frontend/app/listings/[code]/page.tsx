@@ -148,22 +148,32 @@ export default function ListingsPage() {
         }
 
         const BACKEND_BASE = (process.env.NEXT_PUBLIC_BACKEND_URL ?? "").replace(/\/$/, "");
-        const gmapApiFetches = uniquePlaces.map(async (place) => { 
-            const params = new URLSearchParams({ name: place.name || "Location", lat: place.lat.toString(), lng: place.lon.toString(), radius: "50" });
-            const url = `${BACKEND_BASE}/api/gmap/search?${params.toString()}`;
-            try {
-              const res = await fetch(url);
-              if (res.ok) {
-                const gmapData = await res.json();
-                return { ...place, ...gmapData };
-              }
-              return { ...place, element_id: place.id, reviews: [], rating: null };
-            } catch (e) {
-              return { ...place, element_id: place.id, reviews: [], rating: null };
-            }
-        });
+        // one batched lookup for every selected place instead of a request per place
+        let batchResults: Record<string, any> = {};
+        try {
+          const res = await fetch(`${BACKEND_BASE}/api/gmap/search/batch`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(
+              uniquePlaces.map((place) => ({
+                id: String(place.id),
+                name: place.name || "Location",
+                lat: place.lat,
+                lng: place.lon,
+                radius: 50,
+              }))
+            ),
+          });
+          if (res.ok) batchResults = (await res.json()).results ?? {};
+        } catch (e) {
+          batchResults = {};
+        }
 
-        const gmapResults = await Promise.all(gmapApiFetches);
+        const gmapResults = uniquePlaces.map((place) => {
+          const entry = batchResults[String(place.id)];
+          if (entry?.status === "ok") return { ...place, ...entry.result };
+          return { ...place, element_id: place.id, reviews: [], rating: null };
+        });
 
         const formattedPlaces: Place[] = gmapResults.map((p: any) => ({
             element_id: String(p.element_id ?? p.id), 
@@ -350,7 +360,9 @@ export default function ListingsPage() {
     try {
       const systemPrompt = buildSystemPromptForPlaces(places);
 
-      const setPromptUrl = BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/gemini/set_prompt` : "/api/gemini/set_prompt";
+      const setPromptUrl =
+        (BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/gemini/set_prompt` : "/api/gemini/set_prompt") +
+        `?room=${encodeURIComponent(code)}`;
 
       const setResp = await fetch(setPromptUrl, {
         method: "POST",
@@ -363,15 +375,26 @@ export default function ListingsPage() {
         throw new Error(`Failed to call Gemini set_prompt: ${setResp.status} ${txt}`);
       }
 
-      const getResponseUrl = BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/gemini/get_response` : "/api/gemini/get_response";
-      let getResp = await fetch(getResponseUrl);
-      let resultJson = await getResp.json().catch(() => ({ response: null }));
-      if (!resultJson || !resultJson.response) {
-        const genUrl = BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/gemini/generate` : "/api/gemini/generate";
-        await fetch(genUrl, { method: "POST" });
-        await new Promise((r) => setTimeout(r, 500));
-        getResp = await fetch(getResponseUrl);
-        resultJson = await getResp.json().catch(() => ({ response: null }));
+      // generation runs as a background job: long-poll it until it finishes
+      const setJson = await setResp.json().catch(() => ({}));
+      if (!setJson || !setJson.job_id) {
+        throw new Error(setJson?.error || "Gemini generation was not started.");
+      }
+      const jobUrl =
+        BACKEND_BASE !== ""
+          ? `${BACKEND_BASE}/api/gemini/jobs/${setJson.job_id}`
+          : `/api/gemini/jobs/${setJson.job_id}`;
+      let resultJson: any = { status: "pending" };
+      for (let attempt = 0; attempt < 4 && resultJson.status === "pending"; attempt++) {
+        const jobResp = await fetch(`${jobUrl}?wait=25`);
+        if (!jobResp.ok) {
+          const txt = await jobResp.text().catch(() => "");
+          throw new Error(`Failed to fetch Gemini job: ${jobResp.status} ${txt}`);
+        }
+        resultJson = await jobResp.json();
+      }
+      if (resultJson.status === "error") {
+        throw new Error(`Gemini generation failed: ${resultJson.error}`);
       }
 
       const rawResponse: string = (resultJson && resultJson.response) ? String(resultJson.response).trim() : "";
@@ -272,7 +272,9 @@ export default function MapPlacesPage() {
     (async () => {
       setLoading(true);
       const BACKEND_BASE = (process.env.NEXT_PUBLIC_BACKEND_URL ?? "").replace(/\/$/, "");
-      const url = BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/map/search` : "/api/map/search";
+      const url =
+        (BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/map/search` : "/api/map/search") +
+        `?room=${encodeURIComponent(sessionId)}`;
       try {
         const resp = await fetch(url);
         if (!resp.ok) { throw new Error(`Server error: ${resp.status}`); }
@@ -599,7 +599,8 @@ export default function MapPage() {
     try {
       // 1. Send Polygon to Backend API (Existing Logic)
       const payload = buildPayloadForServer();
-      const url = BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/map/set_sample` : "/api/map/set_sample";
+      const roomQuery = `?room=${encodeURIComponent(code)}`;
+      const url = (BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/map/set_sample` : "/api/map/set_sample") + roomQuery;
 
       const resp = await fetch(url, {
         method: "POST",
@@ -622,7 +623,7 @@ export default function MapPage() {
       if (mergedText) {
         try {
           const promptUrl =
-            BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/gemini/set_prompt` : "/api/gemini/set_prompt";
+            (BACKEND_BASE !== "" ? `${BACKEND_BASE}/api/gemini/set_prompt` : "/api/gemini/set_prompt") + roomQuery;
 
           // <-- IMPORTANT CHANGE: include system_prompt in the body
           const promptResp = await fetch(promptUrl, {